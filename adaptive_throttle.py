@@ -0,0 +1,117 @@
+"""Adaptive request throttle shared by the bots of this repository."""
+from __future__ import annotations
+
+from typing import Any
+
+import pywikibot
+from pywikibot.throttle import Throttle
+
+
+class AdaptiveThrottle(Throttle):
+    """
+    Throttle adapting the read and edit rates to the server load.
+
+    The rates are controlled additive-increase/multiplicative-decrease:
+    every request made while the server is not lagged raises its rate by
+    a fixed step, while a maxlag response or a Retry-After header
+    divides both rates by :attr:`backoff`. The edit rate never exceeds
+    the rate limit of the account reported by ``userinfo``.
+    """
+
+    read_step = 0.5  # requests per second added after each read
+    write_step = 0.05  # edits per second added after each edit
+    backoff = 2.0
+    min_write_delay = 1.0  # used if the account has no edit rate limit
+
+    def __init__(self, site: Any, **kwargs: Any) -> None:
+        """Initialize."""
+        super().__init__(site, **kwargs)
+        self.write_floor = self.min_write_delay
+        self.lagged = False
+
+    @classmethod
+    def install(cls, site: pywikibot.site.APISite) -> AdaptiveThrottle:
+        """Replace the throttle of the site, log in and load the limits."""
+        if isinstance(site.throttle, cls):
+            return site.throttle
+        old = site.throttle
+        throttle = cls(
+            site,
+            mindelay=old.mindelay,
+            maxdelay=old.maxdelay,
+            writedelay=old.writedelay,
+        )
+        site._throttle = throttle  # storage of the cached site property
+        # the rate limits of the account only apply once it is logged in
+        site.login()
+        throttle.load_rate_limits(site)
+        return throttle
+
+    def load_rate_limits(self, site: pywikibot.site.APISite) -> None:
+        """Set the lowest edit delay from the account's rate limits."""
+        request = site.simple_request(
+            action="query", meta="userinfo", uiprop="ratelimits"
+        )
+        userinfo = request.submit()["query"]["userinfo"]
+        limits = userinfo.get("ratelimits", {}).get("edit", {})
+        # every limit which applies to the account has to be respected
+        intervals = [
+            limit["seconds"] / limit["hits"]
+            for limit in limits.values()
+            if limit.get("hits")
+        ]
+        self.write_floor = max(intervals, default=self.min_write_delay)
+        pywikibot.log(
+            f"{self.mysite}: edit delay will not go below "
+            f"{self.write_floor:.2f} seconds."
+        )
+
+    @staticmethod
+    def _faster(delay: float, step: float) -> float:
+        """Return the delay after raising its rate by step."""
+        return 1 / (1 / delay + step) if delay > 0 else 0.0
+
+    def speed_up(self, write: bool = False) -> None:
+        """Raise the read or edit rate by one step."""
+        with self.lock:
+            if write:
+                self.writedelay = max(
+                    self.write_floor,
+                    self._faster(self.writedelay, self.write_step),
+                )
+            else:
+                self.delay = max(
+                    self.mindelay, self._faster(self.delay, self.read_step)
+                )
+
+    def slow_down(self) -> None:
+        """Divide the read and edit rates by the backoff factor."""
+        with self.lock:
+            self.delay = min(self.maxdelay, max(self.delay * self.backoff, 1))
+            self.writedelay = min(
+                self.maxdelay,
+                max(self.writedelay * self.backoff, self.write_floor),
+            )
+            pywikibot.log(
+                f"{self.mysite}: slowing down to {self.delay:.2f} seconds "
+                f"per read and {self.writedelay:.2f} seconds per edit."
+            )
+
+    def __call__(self, requestsize: int = 1, write: bool = False) -> None:
+        """Adapt the rate to the previous request, then wait."""
+        if self.retry_after:
+            # the previous response asked to retry later
+            self.slow_down()
+            self.wait(self.retry_after)
+            self.retry_after = 0
+        elif not self.lagged:
+            self.speed_up(write)
+        self.lagged = False
+        super().__call__(requestsize, write)
+
+    def lag(self, lagtime: float | None = None) -> None:
+        """Slow down due to server lag and wait."""
+        self.lagged = True
+        self.slow_down()
+        super().lag(lagtime)
+        self.retry_after = 0  # already waited for
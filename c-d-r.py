@@ -7,11 +7,50 @@ The following parameters are supported:
 
 -summary          Specify an edit aummary for the bot.
 
+-watch[:n]        Follow the recent changes of the category namespace and
+                  fix new double redirects as they appear, polling every n
+                  seconds (default: 60). The redirects are indexed by their
+                  targets in c-d-r-index-<family>-<code>.json; delete that
+                  file to build the index again.
+
+-recat            Also move the members of each category redirect to its
+                  final target. Members whose category is added by a
+                  template are left alone. Progress is saved in
+                  c-d-r-recat-<family>-<code>.json.
+
+-batch:n          Number of pages loaded at once, at most the API limit
+                  (default: 50).
+
+-deletioncat:x    Categories of pages pending deletion, separated by "|".
+                  Redirects whose final target is in one of them, or does
+                  not exist, are reported and not edited.
+
+-resume           Continue an interrupted run: the pages completed by the
+                  previous run over the generator are skipped. The progress
+                  of every run is saved in c-d-r-resume-<family>-<code>.json,
+                  which is removed when a run completes.
+
+-buffer:n         Number of batches loaded ahead in the background while
+                  the current batch is treated (default: 2).
+
+-record:file      Record the HTTP traffic to a compressed cassette file.
+
+-replay:file      Answer the HTTP requests from a cassette file, offline.
+
+-latency:x        Multiply the replayed latencies by x (default: 1).
+
 &params;
 """
 from __future__ import annotations
 
-from typing import Any
+import json
+import os
+import re
+import threading
+from contextlib import suppress
+from functools import partial
+from queue import Full, Queue
+from typing import Any, Iterable, Iterator
 
 import mwparserfromhell
 import pywikibot
@@ -20,28 +59,226 @@ from pywikibot.pagegenerators import GeneratorFactory, parameterHelp
 from pywikibot.textlib import removeDisabledParts
 from pywikibot_extensions.page import get_redirects
 
+from adaptive_throttle import AdaptiveThrottle
+from cassette import handle_cassette_args
+from request_memo import RequestMemo
+
 
 docuReplacements = {  # noqa: N816 # pylint: disable=invalid-name
     "&params;": parameterHelp
 }
 
 
+class CategoryRedirectIndex:
+    """
+    Persistent reverse index of category redirects, target to sources.
+
+    The index is saved with the time up to which it reflects the edits
+    of the wiki, so that it can be brought up to date from the recent
+    changes instead of being built again.
+    """
+
+    def __init__(self, filename: str) -> None:
+        """Initialize."""
+        self.filename = filename
+        self.cursor: pywikibot.Timestamp | None = None
+        self.targets: dict[str, str] = {}
+        self.sources: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def load(self) -> bool:
+        """Load the saved index; return whether there was one."""
+        try:
+            with open(self.filename, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        self.cursor = pywikibot.Timestamp.fromISOformat(data["cursor"])
+        for source, target in data["targets"].items():
+            self.update(source, target)
+        return True
+
+    def save(self) -> None:
+        """Save the index."""
+        with open(self.filename, "w", encoding="utf-8") as f:
+            json.dump(
+                {"cursor": self.cursor.isoformat(), "targets": self.targets},
+                f,
+                ensure_ascii=False,
+            )
+
+    def update(self, source: str, target: str | None) -> str | None:
+        """
+        Set the target of a category; None if it is no redirect.
+
+        :return: the previous target
+        """
+        old = self.targets.pop(source, None)
+        if old is not None:
+            self.sources[old].discard(source)
+            if not self.sources[old]:
+                del self.sources[old]
+        if target is not None:
+            self.targets[source] = target
+            self.sources.setdefault(target, set()).add(source)
+        return old
+
+    def redirects_to(self, target: str) -> set[str]:
+        """Return the categories which redirect to the target."""
+        return set(self.sources.get(target, ()))
+
+
+class SkipCache:
+    """
+    Persistent cache of the categories which were found not to need a fix.
+
+    A category is keyed by its title and maps to its revision ID, the
+    title and revision ID of its redirect target (None if it is no
+    redirect) and the verdict. The verdict holds as long as neither
+    revision changed.
+    """
+
+    def __init__(self, filename: str) -> None:
+        """Initialize."""
+        self.filename = filename
+        self.entries: dict[str, list] = {}
+        self.hits = 0
+        try:
+            with open(filename, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+
+    def target(self, title: str) -> str | None:
+        """Return the cached redirect target of a category."""
+        return self.entries.get(title, (None, None))[1]
+
+    def valid(self, title: str, revids: dict[str, int]) -> bool:
+        """Return whether the category can be skipped at these revisions."""
+        entry = self.entries.get(title)
+        if entry is None:
+            return False
+        revid, target, target_revid, verdict = entry
+        return (
+            verdict == "skip"
+            and revids.get(title) == revid
+            and (target is None or revids.get(target) == target_revid)
+        )
+
+    def put(
+        self,
+        page: pywikibot.Page,
+        target: pywikibot.Page | None,
+        verdict: str = "skip",
+    ) -> None:
+        """Record the verdict about the loaded page and target."""
+        self.entries[page.title()] = [
+            page.latest_revision_id,
+            None if target is None else target.title(),
+            None if target is None else target.latest_revision_id,
+            verdict,
+        ]
+
+    def save(self) -> None:
+        """Save the cache."""
+        with open(self.filename, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+
+
 class CategoryDoubleRedirectFixerBot(SingleSiteBot, ExistingPageBot):
     """Bot to fix double (or more) category redirects."""
 
     update_options = {
         "summary": "Sửa đổi hướng kép",
+        "watch": 0,
+        "recat": False,
+        "batch": 50,
+        "buffer": 2,
+        "resume": False,
+        "deletioncat": "",
     }
+    memo_cycle = 50  # pages treated before the request memo is cleared
+    checkpoint_interval = 50  # saved members between recat checkpoints
+    resume_interval = 100  # completed pages between resume checkpoints
+    max_chain = 5  # redirect levels prefetched per batch
 
     def __init__(self, **kwargs: Any) -> None:
         """Initialize."""
         super().__init__(**kwargs)
+        self.index: CategoryRedirectIndex | None = None
         self.templates = get_redirects(
             frozenset(
                 (pywikibot.Page(self.site, "Category redirect", ns=10),)
             ),
             namespaces=10,
         )
+        self.skip_cache = SkipCache(
+            pywikibot.config.datafilepath(
+                f"c-d-r-skip-{self.site.family.name}-{self.site.code}.json"
+            )
+        )
+        self.deletion_categories = [
+            pywikibot.Category(self.site, title).title()
+            for title in self.opt.deletioncat.split("|")
+            if title.strip()
+        ]
+        self.target_status: dict[str, str | None] = {}
+        self.done: set[str] = set()
+        self.last_done: str | None = None
+        self.completed = False
+        self.recat_lock = threading.Lock()
+        self.recat_done: dict[str, set[str]] = {}
+        self.recat_finished: set[str] = set()
+        if self.opt.recat:
+            try:
+                with open(self.recat_filename, encoding="utf-8") as f:
+                    self.recat_done = {
+                        source: set(titles)
+                        for source, titles in json.load(f).items()
+                    }
+            except FileNotFoundError:
+                pass
+        if self.opt.watch:
+            self.generator = self.watch()
+        elif self.generator is not None:
+            self.load_resume_checkpoint()
+            self.generator = self.checkpointed(
+                self.prefetch(self.batches(self.skip_done(self.generator)))
+            )
+
+    def setup(self) -> None:
+        """Adapt the request rates to the server load."""
+        super().setup()
+        AdaptiveThrottle.install(self.site)
+        self.request_memo = RequestMemo.install()
+        # longer title lists are cut short by the API
+        self.opt.batch = min(self.opt.batch, self.site.maxlimit)
+
+    def teardown(self) -> None:
+        """Save the caches and report the memo statistics."""
+        super().teardown()
+        if self.opt.recat:
+            pywikibot.output("Waiting for the pending member edits...")
+            pywikibot.page_put_queue.join()
+            with self.recat_lock:
+                for source in self.recat_finished:
+                    self.recat_done.pop(source, None)
+            self.save_recat_checkpoint()
+        if self.index is not None and self.index.cursor is not None:
+            self.index.save()
+        self.skip_cache.save()
+        pywikibot.output(
+            f"{self.skip_cache.hits} categories skipped as unchanged."
+        )
+        if not self.opt.watch:
+            if self.completed:
+                with suppress(FileNotFoundError):
+                    os.remove(self.resume_filename)
+            elif self.done:
+                self.save_resume_checkpoint()
+        pywikibot.output(str(self.request_memo))
 
     def init_page(self, item: Any) -> pywikibot.Page:
         """Re-class the page."""
@@ -60,12 +297,249 @@ class CategoryDoubleRedirectFixerBot(SingleSiteBot, ExistingPageBot):
             return True
         if not page.isCategoryRedirect():
             pywikibot.error(f"{page!r} is not a category redirect")
+            self.skip_cache.put(page, None)
             return True
-        target = page.getCategoryRedirectTarget()
+        target = self.target_category(page)
         if not target.isCategoryRedirect():
+            if self.opt.recat:
+                return False  # its members may still have to be moved
+            if target.exists():
+                self.skip_cache.put(page, target)
             return True
         return False
 
+    @property
+    def resume_filename(self) -> str:
+        """Return the file of the resume checkpoint."""
+        return pywikibot.config.datafilepath(
+            f"c-d-r-resume-{self.site.family.name}-{self.site.code}.json"
+        )
+
+    def load_resume_checkpoint(self) -> None:
+        """Load the pages completed by the previous run if resuming."""
+        if not self.opt.resume:
+            return
+        try:
+            with open(self.resume_filename, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            pywikibot.warning("There is no run to be resumed.")
+            return
+        self.done = set(data["done"])
+        self.last_done = data["last"]
+        pywikibot.output(
+            f"Resuming after {self.last_done}, skipping {len(self.done)} "
+            "completed pages."
+        )
+
+    def save_resume_checkpoint(self) -> None:
+        """Save the completed pages atomically."""
+        filename = self.resume_filename
+        with open(filename + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {"last": self.last_done, "done": sorted(self.done)},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(filename + ".tmp", filename)
+
+    def skip_done(
+        self, generator: Iterable[pywikibot.Page]
+    ) -> Iterator[pywikibot.Page]:
+        """Drop the pages completed before, without loading them."""
+        for page in generator:
+            if page.title() not in self.done:
+                yield page
+
+    def checkpointed(
+        self, generator: Iterable[pywikibot.Page]
+    ) -> Iterator[pywikibot.Page]:
+        """
+        Record a page as completed when the bot asks for the next one.
+
+        A page the bot quit on is not completed and is treated again on
+        resume.
+        """
+        for page in generator:
+            yield page
+            self.last_done = page.title()
+            self.done.add(self.last_done)
+            if len(self.done) % self.resume_interval == 0:
+                self.save_resume_checkpoint()
+        self.completed = True
+
+    @staticmethod
+    def target_category(page: pywikibot.Page) -> pywikibot.Category:
+        """Return the redirect target, preloaded if it was prefetched."""
+        target = getattr(page, "_prefetched_target", None)
+        return target or page.getCategoryRedirectTarget()
+
+    def batches(
+        self, generator: Iterable[pywikibot.Page]
+    ) -> Iterator[list[pywikibot.Page]]:
+        """Yield the pages of the generator loaded in batches."""
+        batch: list[pywikibot.Page] = []
+        for page in generator:
+            batch.append(page)
+            if len(batch) == self.opt.batch:
+                yield self.load_batch(batch)
+                batch = []
+        if batch:
+            yield self.load_batch(batch)
+
+    def prefetch(
+        self, batches: Iterator[list[pywikibot.Page]]
+    ) -> Iterator[pywikibot.Page]:
+        """
+        Yield the pages of the batches, loading the next ones meanwhile.
+
+        The batches are produced in a background thread; at most
+        ``-buffer`` batches wait to be treated.
+        """
+        queue: Queue = Queue(maxsize=self.opt.buffer)
+        stop = threading.Event()
+
+        def put(item: Any) -> None:
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=1)
+                    return
+                except Full:
+                    continue
+
+        def produce() -> None:
+            try:
+                for batch in batches:
+                    put(batch)
+                    if stop.is_set():
+                        return
+            except Exception as error:  # pylint: disable=broad-except
+                put(error)
+            finally:
+                put(None)
+
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while (batch := queue.get()) is not None:
+                if isinstance(batch, Exception):
+                    raise batch
+                yield from batch
+        finally:
+            stop.set()
+
+    def load_batch(self, pages: list[pywikibot.Page]) -> list[pywikibot.Page]:
+        """
+        Load one batch of pages and their redirect targets.
+
+        Unless members are recategorized, the pages whose cached skip
+        verdict still holds are dropped first: the revision IDs of the
+        pages and of their cached targets are checked with one query
+        without content. The remaining pages are loaded with their
+        content, then their redirect chains level by level, and the
+        final targets are validated together.
+        """
+        if not self.opt.recat:
+            # the members of a category change without a new revision
+            pages = self.skip_unchanged(pages)
+        pages = list(
+            self.site.preloadpages(
+                pages, groupsize=self.opt.batch, templates=True
+            )
+        )
+        level: dict[str, pywikibot.Category] = {}
+        for page in pages:
+            if page.exists() and page.isCategoryRedirect():
+                target = page.getCategoryRedirectTarget()
+                page._prefetched_target = level.setdefault(
+                    target.title(), target
+                )
+        visited: set[str] = set()
+        finals = []
+        for _ in range(self.max_chain):
+            if not level:
+                break
+            visited.update(level)
+            next_level: dict[str, pywikibot.Category] = {}
+            for target in self.site.preloadpages(
+                list(level.values()),
+                groupsize=self.opt.batch,
+                templates=True,
+            ):
+                if not target.exists():
+                    self.target_status[target.title()] = "does not exist"
+                elif not target.isCategoryRedirect():
+                    finals.append(target.title())
+                else:
+                    following = target.getCategoryRedirectTarget()
+                    if following.title() in visited:
+                        continue  # circular, reported by treat_page
+                    target._prefetched_target = next_level.setdefault(
+                        following.title(), following
+                    )
+            level = next_level
+        self.check_targets(finals)
+        return pages
+
+    def check_targets(self, titles: list[str]) -> dict[str, str | None]:
+        """
+        Return the problems of final targets keyed by title.
+
+        The targets not checked yet are queried in batches for their
+        existence and their deletion categories.
+        """
+        unknown = [
+            title for title in titles if title not in self.target_status
+        ]
+        for start in range(0, len(unknown), self.opt.batch):
+            end = start + self.opt.batch
+            request = self.site.simple_request(
+                action="query", prop="info", titles=unknown[start:end]
+            )
+            if self.deletion_categories:
+                request["prop"] = ["info", "categories"]
+                request["clcategories"] = self.deletion_categories
+                request["cllimit"] = "max"
+            pages = request.submit()["query"].get("pages", {})
+            for page in pages.values():
+                if "missing" in page or "invalid" in page:
+                    problem = "does not exist"
+                elif page.get("categories"):
+                    problem = "is pending deletion in " + ", ".join(
+                        category["title"] for category in page["categories"]
+                    )
+                else:
+                    problem = None
+                self.target_status[page["title"]] = problem
+        return {title: self.target_status.get(title) for title in titles}
+
+    def skip_unchanged(
+        self, pages: list[pywikibot.Page]
+    ) -> list[pywikibot.Page]:
+        """Drop the pages whose cached skip verdict still holds."""
+        known = [
+            page for page in pages if page.title() in self.skip_cache.entries
+        ]
+        revids: dict[str, int] = {}
+        if known:
+            titles = {page.title() for page in known}
+            titles.update(
+                filter(None, map(self.skip_cache.target, list(titles)))
+            )
+            for page in self.site.preloadpages(
+                [pywikibot.Page(self.site, title) for title in titles],
+                groupsize=self.opt.batch,
+                content=False,
+            ):
+                if page.exists():
+                    revids[page.title()] = page.latest_revision_id
+        todo = []
+        for page in pages:
+            if self.skip_cache.valid(page.title(), revids):
+                self.skip_cache.hits += 1
+            else:
+                todo.append(page)
+        return todo
+
     def check_disabled(self) -> None:
         """Check if the task is disabled. If so, quit."""
         class_name = self.__class__.__name__
@@ -73,19 +547,223 @@ class CategoryDoubleRedirectFixerBot(SingleSiteBot, ExistingPageBot):
             self.site,
             f"User:{self.site.username()}/shutoff/{class_name}.json",
         )
-        if page.exists():
+        try:
             content = page.get(force=True).strip()
-            if content:
-                pywikibot.error(f"{class_name} disabled:\n{content}")
-                self.quit()
+        except pywikibot.exceptions.NoPageError:
+            return
+        if content:
+            pywikibot.error(f"{class_name} disabled:\n{content}")
+            self.quit()
+
+    def redirect_template(
+        self, wikicode: mwparserfromhell.wikicode.Wikicode
+    ) -> mwparserfromhell.nodes.Template | None:
+        """Return the first category redirect template of the wikicode."""
+        for tpl in wikicode.ifilter_templates():
+            try:
+                template = pywikibot.Page(
+                    self.site,
+                    removeDisabledParts(str(tpl.name), site=self.site),
+                    ns=10,
+                )
+                template.title()
+            except pywikibot.exceptions.InvalidTitleError:
+                continue
+            if template in self.templates:
+                return tpl
+        return None
+
+    def redirect_target(self, page: pywikibot.Page) -> str | None:
+        """Return the target title of a category redirect without API."""
+        if not page.exists():
+            return None
+        tpl = self.redirect_template(
+            mwparserfromhell.parse(page.text, skip_style_tags=True)
+        )
+        if tpl is None or not tpl.has("1"):
+            return None
+        value = removeDisabledParts(str(tpl.get("1").value), site=self.site)
+        try:
+            return pywikibot.Category(self.site, value.strip()).title()
+        except (pywikibot.exceptions.InvalidTitleError, ValueError):
+            return None
+
+    def load_index(self) -> CategoryRedirectIndex:
+        """Load the index of category redirects or build it."""
+        index = CategoryRedirectIndex(
+            pywikibot.config.datafilepath(
+                f"c-d-r-index-{self.site.family.name}-{self.site.code}.json"
+            )
+        )
+        if index.load():
+            pywikibot.output(
+                f"Loaded {len(index)} category redirects indexed up to "
+                f"{index.cursor}."
+            )
+            return index
+
+        # edits made while building are caught up by the first poll
+        index.cursor = self.site.server_time()
+        template = pywikibot.Page(self.site, "Category redirect", ns=10)
+        for page in template.embeddedin(namespaces=14, content=True):
+            index.update(page.title(), self.redirect_target(page))
+        index.save()
+        pywikibot.output(f"Indexed {len(index)} category redirects.")
+        return index
+
+    def changed_categories(
+        self, index: CategoryRedirectIndex, titles: Iterable[str]
+    ) -> Iterator[pywikibot.Category]:
+        """
+        Yield the categories to be checked after the given pages changed.
+
+        Only categories whose redirect status or target changed are
+        considered: such a category itself, if it is a redirect now, and
+        the categories redirecting to it.
+        """
+        pages = [
+            pywikibot.Category(self.site, title)
+            for title in titles
+            if pywikibot.Page(self.site, title).namespace() == 14
+        ]
+        queue = set()
+        for page in self.site.preloadpages(pages):
+            title = page.title()
+            target = self.redirect_target(page)
+            if index.update(title, target) == target:
+                continue
+            if target is not None:
+                queue.add(title)
+            queue.update(index.redirects_to(title))
+        if queue:
+            yield from self.site.preloadpages(
+                [pywikibot.Category(self.site, title) for title in queue],
+                templates=True,
+            )
+
+    def watch(self) -> Iterator[pywikibot.Category]:
+        """Yield new double redirects by polling the recent changes."""
+        index = self.index = self.load_index()
+        while True:
+            # every poll asks the wiki again
+            self.request_memo.clear()
+            self.target_status.clear()
+            with self.request_memo.bypass():
+                now = self.site.server_time()
+            titles = set()
+            for change in self.site.recentchanges(
+                start=index.cursor, end=now, reverse=True, namespaces=14
+            ):
+                titles.add(change["title"])
+                params = change.get("logparams", {})
+                if "target_title" in params:
+                    titles.add(params["target_title"])
+            yield from self.changed_categories(index, titles)
+            index.cursor = now
+            index.save()
+            pywikibot.sleep(self.opt.watch)
+
+    @property
+    def recat_filename(self) -> str:
+        """Return the file of the recategorization checkpoint."""
+        return pywikibot.config.datafilepath(
+            f"c-d-r-recat-{self.site.family.name}-{self.site.code}.json"
+        )
+
+    def save_recat_checkpoint(self) -> None:
+        """Save the members already moved, by source category."""
+        with self.recat_lock:
+            data = {
+                source: sorted(titles)
+                for source, titles in self.recat_done.items()
+            }
+        with open(self.recat_filename, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def category_pattern(self, category: pywikibot.Category) -> re.Pattern:
+        """Compile a pattern of the links to a category."""
+
+        def words(text: str) -> str:
+            return r"[ _]+".join(map(re.escape, text.split(" ")))
+
+        namespaces = "|".join(map(words, self.site.namespaces[14]))
+        title = category.title(with_ns=False)
+        first = re.escape(title[0].upper()) + re.escape(title[0].lower())
+        rest = words(title[1:])
+        return re.compile(
+            rf"\[\[[ _]*(?i:{namespaces})[ _]*:[ _]*[{first}]{rest}[ _]*"
+            r"(?P<sortkey>\|[^\]]*)?\]\](?P<eol>[ \t]*\n)?"
+        )
+
+    def recategorize(
+        self, source: pywikibot.Category, target: pywikibot.Category
+    ) -> None:
+        """
+        Move the members of a category redirect to the final target.
+
+        The members are retrieved with their content, and the edits are
+        queued to pywikibot's asynchronous, throttled save queue.
+        """
+        pattern = self.category_pattern(source)
+        present = self.category_pattern(target)
+        title = source.title()
+        replacement = f"[[{target.title()}"
+        summary = (
+            f"Chuyển {source.title(as_link=True, textlink=True)} sang "
+            f"{target.title(as_link=True, textlink=True)}"
+        )
+        with self.recat_lock:
+            done = self.recat_done.setdefault(title, set())
+        for page in source.members(content=True):
+            if page.title() in done:
+                continue
+            text = page.text
+            if present.search(text):
+                new_text = pattern.sub("", text)
+            else:
+                new_text = pattern.sub(
+                    lambda match: replacement
+                    + (match["sortkey"] or "")
+                    + "]]"
+                    + (match["eol"] or ""),
+                    text,
+                )
+            if new_text == text:
+                pywikibot.log(f"{page!r} is not in {source!r} by a link.")
+                with self.recat_lock:
+                    done.add(page.title())
+                continue
+            self.userPut(
+                page,
+                text,
+                new_text,
+                summary=summary,
+                asynchronous=True,
+                callback=partial(self._recategorized, title),
+            )
+        self.recat_finished.add(title)
+
+    def _recategorized(
+        self, source: str, page: pywikibot.Page, error: Exception | None
+    ) -> None:
+        """Record a saved member; called by the save queue."""
+        if error is not None:
+            return
+        with self.recat_lock:
+            self.recat_done[source].add(page.title())
+            count = sum(map(len, self.recat_done.values()))
+        if count % self.checkpoint_interval == 0:
+            self.save_recat_checkpoint()
 
     def treat_page(self) -> None:
         """Process one page."""
+        if self.counter["read"] % self.memo_cycle == 0:
+            self.request_memo.clear()
         self.check_disabled()
-        target = self.current_page.getCategoryRedirectTarget()
+        target = self.target_category(self.current_page)
         seen = {self.current_page, target}
         while target.isCategoryRedirect():
-            target = target.getCategoryRedirectTarget()
+            target = self.target_category(target)
             if target in seen:
                 pywikibot.error(
                     f"Skipping {self.current_page!r} due to possible circular"
@@ -93,23 +771,30 @@ class CategoryDoubleRedirectFixerBot(SingleSiteBot, ExistingPageBot):
                 )
                 return
             seen.add(target)
+        problem = self.check_targets([target.title()])[target.title()]
+        if problem:
+            pywikibot.error(
+                f"Skipping {self.current_page!r}: its final target "
+                f"{target!r} {problem}."
+            )
+            return
+        if len(seen) == 2:  # not a double redirect
+            if self.opt.recat:
+                self.recategorize(self.current_page, target)
+            return
         wikicode = mwparserfromhell.parse(
             self.current_page.text, skip_style_tags=True
         )
-        for tpl in wikicode.ifilter_templates():
-            try:
-                template = pywikibot.Page(
-                    self.site,
-                    removeDisabledParts(str(tpl.name), site=self.site),
-                    ns=10,
-                )
-                template.title()
-            except pywikibot.exceptions.InvalidTitleError:
-                continue
-            if template in self.templates:
-                tpl.add("1", target.title(with_ns=False))
-                break
-        self.put_current(str(wikicode), summary=self.opt.summary)
+        tpl = self.redirect_template(wikicode)
+        if tpl is not None:
+            tpl.add("1", target.title(with_ns=False))
+        if (
+            self.put_current(str(wikicode), summary=self.opt.summary)
+            and self.index is not None
+        ):
+            self.index.update(self.current_page.title(), target.title())
+        if self.opt.recat:
+            self.recategorize(self.current_page, target)
 
 
 def main(*args: str) -> int:
@@ -119,7 +804,7 @@ def main(*args: str) -> int:
     :param args: command line arguments
     """
     options = {}
-    local_args = pywikibot.handle_args(args)
+    local_args = handle_cassette_args(pywikibot.handle_args(args))
     site = pywikibot.Site()
     site.login()
     gen_factory = GeneratorFactory(site)
@@ -127,15 +812,22 @@ def main(*args: str) -> int:
     for arg in script_args:
         arg, _, value = arg.partition(":")
         arg = arg[1:]
-        if arg == "summary":
+        if arg in ("summary", "deletioncat"):
             if not value:
                 value = pywikibot.input(
                     f"Please enter a value for {arg}", default=None
                 )
             options[arg] = value
+        elif arg == "watch":
+            options[arg] = int(value) if value else 60
+        elif arg in ("batch", "buffer"):
+            options[arg] = int(
+                value or pywikibot.input(f"Please enter a value for {arg}")
+            )
         else:
             options[arg] = True
-    gen = gen_factory.getCombinedGenerator(preload=True)
+    # loaded in batches after the skip cache has been checked
+    gen = gen_factory.getCombinedGenerator()
     CategoryDoubleRedirectFixerBot(generator=gen, site=site, **options).run()
     return 0
 
@@ -0,0 +1,184 @@
+"""Record and replay the HTTP traffic of the bots of this repository."""
+from __future__ import annotations
+
+import atexit
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable
+from urllib.parse import parse_qsl, urlsplit
+
+import pywikibot
+import requests
+from pywikibot.comms import http
+from pywikibot.exceptions import Error
+
+# parameters which differ between a recording and its replay
+VOLATILE_PARAMS = frozenset(
+    {"token", "lgtoken", "logintoken", "createtoken", "maxlag"}
+)
+# never written to a cassette; replays log in with any account
+CREDENTIAL_PARAMS = frozenset(
+    {"lgname", "lgpassword", "username", "password", "retype", "OATHToken"}
+)
+
+
+class CassetteMissError(Error):
+    """A request was not found in the cassette."""
+
+
+def request_key(method: str, uri: str, data: Any = None) -> str:
+    """Return the normalized form of a request."""
+    parts = urlsplit(uri)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", "replace")
+    if isinstance(data, str):
+        params += parse_qsl(data, keep_blank_values=True)
+    elif isinstance(data, dict):
+        params += [(key, str(value)) for key, value in data.items()]
+    params = sorted(
+        (key, value)
+        for key, value in params
+        if key not in VOLATILE_PARAMS and key not in CREDENTIAL_PARAMS
+    )
+    return json.dumps(
+        [method.upper(), parts.netloc + parts.path, params],
+        ensure_ascii=False,
+    )
+
+
+class Cassette:
+    """
+    Cassette of HTTP requests and responses with their timings.
+
+    In record mode every request made through pywikibot is appended to
+    a gzip-compressed JSON lines file. In replay mode the requests are
+    answered from such a file without network access, in the recorded
+    order per request, after the recorded latency multiplied by
+    :attr:`latency`.
+    """
+
+    def __init__(self, filename: str, latency: float = 1.0) -> None:
+        """Initialize."""
+        self.filename = filename
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.started = time.monotonic()
+        self.responses: dict[str, deque] = defaultdict(deque)
+        self.file = None
+        self._fetch: Callable | None = None
+
+    def _install(self, fetch: Callable) -> None:
+        """Route pywikibot's HTTP requests through the given function."""
+        self._fetch = http.fetch
+        http.fetch = fetch
+        atexit.register(self.close)
+
+    def record(self) -> Cassette:
+        """Start recording the requests."""
+        self.file = gzip.open(self.filename, "at", encoding="utf-8")
+        self._install(self.recording_fetch)
+        return self
+
+    def replay(self) -> Cassette:
+        """Start answering the requests from the cassette."""
+        with gzip.open(self.filename, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self.responses[entry["key"]].append(entry)
+        self._install(self.replaying_fetch)
+        return self
+
+    def recording_fetch(
+        self, uri: str, method: str = "GET", **kwargs: Any
+    ) -> requests.Response:
+        """Fetch the URI and record the request and response."""
+        start = time.monotonic()
+        response = self._fetch(uri, method, **kwargs)
+        elapsed = time.monotonic() - start
+        if isinstance(response, requests.Response):
+            entry = {
+                "key": request_key(method, uri, kwargs.get("data")),
+                "time": round(start - self.started, 3),
+                "elapsed": round(elapsed, 3),
+                "status": response.status_code,
+                "headers": {
+                    name: response.headers[name]
+                    for name in ("content-type", "retry-after")
+                    if name in response.headers
+                },
+                "text": response.text,
+            }
+            line = json.dumps(entry, ensure_ascii=False) + "\n"
+            with self.lock:
+                self.requests += 1
+                self.file.write(line)
+        return response
+
+    def replaying_fetch(
+        self, uri: str, method: str = "GET", **kwargs: Any
+    ) -> requests.Response:
+        """Answer the request from the cassette."""
+        key = request_key(method, uri, kwargs.get("data"))
+        with self.lock:
+            queue = self.responses.get(key)
+            if not queue:
+                raise CassetteMissError(f"{method} {uri} is not recorded")
+            # the last response of a request answers its later repetitions
+            entry = queue.popleft() if len(queue) > 1 else queue[0]
+            self.requests += 1
+        time.sleep(entry["elapsed"] * self.latency)
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers.update(entry["headers"])
+        response._content = entry["text"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = uri
+        return response
+
+    def close(self) -> None:
+        """Stop routing the requests and report them."""
+        if self._fetch is None:
+            return
+        http.fetch = self._fetch
+        self._fetch = None
+        if self.file is not None:
+            self.file.close()
+        mode = "Recorded" if self.file is not None else "Replayed"
+        pywikibot.output(
+            f"{mode} {self.requests} requests in "
+            f"{time.monotonic() - self.started:.1f} seconds."
+        )
+
+
+def handle_cassette_args(args: list[str]) -> list[str]:
+    """
+    Process the cassette options and return the other arguments.
+
+    -record:FILE    record the HTTP traffic to FILE
+    -replay:FILE    answer the HTTP requests from FILE
+    -latency:X      multiply the replayed latencies by X (default: 1)
+    """
+    options: dict[str, str] = {}
+    others = []
+    for arg in args:
+        name, _, value = arg.partition(":")
+        if name in ("-record", "-replay", "-latency"):
+            options[name] = value or pywikibot.input(
+                f"Please enter a value for {name[1:]}"
+            )
+        else:
+            others.append(arg)
+    if "-record" in options and "-replay" in options:
+        raise ValueError("-record and -replay cannot be combined")
+    if "-record" in options:
+        Cassette(options["-record"]).record()
+    elif "-replay" in options:
+        Cassette(
+            options["-replay"], float(options.get("-latency", 1))
+        ).replay()
+    return others
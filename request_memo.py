@@ -0,0 +1,155 @@
+"""Per-cycle memoization of API read requests shared by the bots."""
+from __future__ import annotations
+
+import copy
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+import pywikibot
+from pywikibot.data import api
+
+# session state which pywikibot reloads on purpose, e.g. after login
+UNCACHED_META = frozenset({"tokens", "userinfo", "siteinfo"})
+
+
+def _text(value: Any) -> str:
+    """Return a request parameter value as the API receives it."""
+    if isinstance(value, pywikibot.page.BasePage):
+        return value.title(with_section=False)
+    return str(value)
+
+
+class RequestMemo:
+    """
+    Memo of API query responses keyed by their normalized parameters.
+
+    Once installed, every :class:`pywikibot.data.api.Request` of the
+    process goes through the memo, and identical read queries are
+    answered from it until :meth:`clear` is called at the start of the
+    next cycle. A write request invalidates the entries for the page it
+    edited and all entries which are not bound to titles. Requests made
+    within :meth:`bypass`, which includes every ``page.get(force=True)``,
+    are always submitted and refresh the memo.
+    """
+
+    _instance: RequestMemo | None = None
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.responses: dict[tuple, dict] = {}
+        self.by_title: dict[str, set[tuple]] = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def install(cls) -> RequestMemo:
+        """Route the API requests of this process through the memo."""
+        if cls._instance is None:
+            memo = cls._instance = cls()
+            submit = api.Request.submit
+
+            def memoized_submit(request: api.Request) -> dict:
+                return memo.submit(request, submit)
+
+            api.Request.submit = memoized_submit
+
+            get = pywikibot.page.BasePage.get
+
+            def forcible_get(
+                page: pywikibot.page.BasePage,
+                force: bool = False,
+                *args: Any,
+                **kwargs: Any,
+            ) -> Any:
+                if not force:
+                    return get(page, force, *args, **kwargs)
+                with memo.bypass():
+                    return get(page, force, *args, **kwargs)
+
+            pywikibot.page.BasePage.get = forcible_get
+        return cls._instance
+
+    @contextmanager
+    def bypass(self) -> Iterator[None]:
+        """Submit the requests of this thread without using the memo."""
+        previous = getattr(self.local, "bypass", False)
+        self.local.bypass = True
+        try:
+            yield
+        finally:
+            self.local.bypass = previous
+
+    @staticmethod
+    def cacheable(request: api.Request) -> bool:
+        """Return whether the response of the request may be reused."""
+        if request.write or request.action != "query":
+            return False
+        return UNCACHED_META.isdisjoint(request.get("meta", []))
+
+    @staticmethod
+    def key(request: api.Request) -> tuple:
+        """Return the normalized parameters of the request."""
+        return (
+            str(request.site),
+            tuple(
+                sorted(
+                    (name, tuple(_text(value) for value in values))
+                    for name, values in request.items()
+                )
+            ),
+        )
+
+    def submit(
+        self, request: api.Request, submit: Callable[[api.Request], dict]
+    ) -> dict:
+        """Answer the request from the memo or submit it."""
+        if not self.cacheable(request):
+            result = submit(request)
+            if request.write:
+                titles = request.get("title", [])
+                self.invalidate(_text(titles[0]) if titles else None)
+            return result
+
+        key = self.key(request)
+        with self.lock:
+            if key in self.responses and not getattr(
+                self.local, "bypass", False
+            ):
+                self.hits += 1
+                return copy.deepcopy(self.responses[key])
+        result = submit(request)
+        with self.lock:
+            self.misses += 1
+            self.responses[key] = copy.deepcopy(result)
+            for title in request.get("titles", []):
+                self.by_title.setdefault(_text(title), set()).add(key)
+        return result
+
+    def invalidate(self, title: str | None = None) -> None:
+        """
+        Forget the entries which may be changed by an edit.
+
+        :param title: title of the edited page; if None, forget all
+        """
+        with self.lock:
+            if title is None:
+                self.responses.clear()
+                self.by_title.clear()
+                return
+            stale = self.by_title.pop(title, set())
+            bound = set().union(*self.by_title.values())
+            stale.update(key for key in self.responses if key not in bound)
+            for key in stale:
+                self.responses.pop(key, None)
+
+    def clear(self) -> None:
+        """Start a new cycle."""
+        self.invalidate()
+
+    def __str__(self) -> str:
+        """Return the statistics of the memo."""
+        total = self.hits + self.misses
+        return f"{self.hits} of {total} API queries answered from the memo"
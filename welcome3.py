@@ -1,22 +1,44 @@
+import asyncio
+import bisect
 import codecs
+import heapq
+import json
 import locale
-import pickle
+import mmap
+import os
+import random
 import re
+import sys
+import threading
 import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import suppress
 from datetime import timedelta
 from enum import Enum
-from random import choice
 from textwrap import fill
-from typing import Generator
+from typing import Generator, NamedTuple
 
 import pywikibot
 from pywikibot import config, i18n
-from pywikibot.backports import List
+from pywikibot.backports import List, Set
 from pywikibot.bot import SingleSiteBot
-from pywikibot.exceptions import EditConflictError, Error, HiddenKeyError
+from pywikibot.exceptions import (
+    APIError,
+    EditConflictError,
+    Error,
+    HiddenKeyError,
+    NoPageError,
+    PageCreatedConflictError,
+    ServerError,
+    TimeoutError,
+)
 from pywikibot.tools.formatter import color_format
 
+from adaptive_throttle import AdaptiveThrottle
+from cassette import handle_cassette_args
+from request_memo import RequestMemo
+
 
 locale.setlocale(locale.LC_ALL, '')
 logbook = {
@@ -123,6 +145,14 @@ class Msg(Enum):
     DEFAULT = 'MSG', 'lightpurple'
 
 
+# colorized status headers, formatted once
+status_headers = {
+    message: color_format('{color}[{msg:5}]{default} ', msg=message.value[0],
+                          color=message.value[1])
+    for message in Msg
+}
+
+
 class FilenameNotSet(Error):
 
     """An exception indicating that a signature filename was not specified."""
@@ -134,6 +164,7 @@ class Global:
 
     attachEditCount = 1     # edit count that an user required to be welcomed
     dumpToLog = 15          # number of users that are required to add the log
+    dumpAge = 3600          # seconds after which queued users are logged
     offset = None           # skip users newer than that timestamp
     timeoffset = 0          # skip users newer than # minutes
     recursive = True        # define if the Bot is recursive or not
@@ -141,6 +172,7 @@ class Global:
     makeWelcomeLog = True   # create the welcome log or not
     confirm = False         # should bot ask to add user to bad-username list
     welcomeAuto = False     # should bot welcome auto-created users
+    sulAge = 0              # skip global accounts older than # days, 0 = off
     filtBadName = False     # check if the username is ok or not
     randomSign = False      # should signature be random or not
     saveSignIndex = False   # should save the signature index or not
@@ -148,24 +180,904 @@ class Global:
     defaultSign = ('~~~~')  # default signature
     queryLimit = 50         # number of users that the bot load to check
     quiet = False           # Users without contributions aren't displayed
+    sites = None            # sites served together by one process
+    editRate = 0            # edits per minute over all sites, 0 = no limit
+    asyncPoll = False       # overlap the API queries of one poll cycle
+    expandTemplates = False  # save the welcome templates pre-substituted
+    screenFile = None       # file of usernames to be screened, no welcome
+    recheckUsers = False    # check users below attachEditCount again later
+    backfill = None         # (start, end) timestamps of a backfill run
+    backfillShard = 24      # hours of the log scanned by one backfill shard
+    eventLog = None         # file of the JSON event log, None = no log
+    logLevel = 'info'       # lowest level written to the event log
+    console = False         # per user output; set by handle_args
+
+
+class EditBudget:
+
+    """Edit rate budget shared by every bot running in this process.
+
+    This is a token bucket refilled with *rate* edits per minute;
+    :meth:`acquire` blocks until the next edit is allowed.
+    """
+
+    def __init__(self, rate: int, burst: int = 1) -> None:
+        """Initializer."""
+        self.interval = 60.0 / rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Wait until the budget allows one more edit."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last) / self.interval)
+            self.last = now
+            if self.tokens < 1:
+                pywikibot.sleep((1 - self.tokens) * self.interval)
+                self.tokens = 1.0
+                self.last = time.monotonic()
+            self.tokens -= 1
+
+
+class FlushQueue:
+
+    """Queue of entries which are written to the wiki in bulk.
+
+    The queue is due to be flushed when it holds *max_size* entries or
+    its oldest entry is *max_age* seconds old. If the wiki is read-only
+    or lagged, the entries are kept and flushing is postponed with a
+    growing delay; once *limit* entries are queued, :meth:`append`
+    blocks until they could be written.
+    """
+
+    min_delay = 60
+    max_delay = 3600
+
+    def __init__(self, write, max_size: int, max_age=None,
+                 limit=None) -> None:
+        """Initializer.
+
+        :param write: callable which writes a list of entries
+        :param max_size: number of entries which makes the queue due
+        :param max_age: age in seconds which makes the queue due
+        :type max_age: int or None
+        :param limit: number of entries held at most, default is
+            ten times *max_size*
+        :type limit: int or None
+        """
+        self.write = write
+        self.max_size = max_size
+        self.max_age = max_age
+        self.limit = limit or 10 * max_size
+        self.entries = []
+        self.since = None
+        self.delay = 0
+        self.retry_at = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def append(self, entry) -> None:
+        """Queue an entry; block while the queue is full."""
+        if not self.entries:
+            self.since = time.monotonic()
+        self.entries.append(entry)
+        while len(self.entries) >= self.limit:
+            pywikibot.sleep(max(0, self.retry_at - time.monotonic()))
+            self.flush()
+
+    def due(self) -> bool:
+        """Return whether the queue should be flushed."""
+        if not self.entries:
+            return False
+        return (len(self.entries) >= self.max_size
+                or self.max_age is not None
+                and time.monotonic() - self.since >= self.max_age)
+
+    def flush_due(self) -> None:
+        """Flush the queue if it is due."""
+        if self.due():
+            self.flush()
+
+    def flush(self) -> bool:
+        """Write and drain all queued entries.
+
+        :return: whether the queue is empty afterwards
+        """
+        if not self.entries:
+            return True
+        if time.monotonic() < self.retry_at:
+            return False
+
+        entries, self.entries = self.entries, []
+        try:
+            self.write(entries)
+        except (APIError, ServerError, TimeoutError) as e:
+            if isinstance(e, APIError) and e.code not in ('readonly',
+                                                          'maxlag'):
+                raise
+            # keep the entries and try again later
+            self.entries[:0] = entries
+            self.delay = min(max(2 * self.delay, self.min_delay),
+                             self.max_delay)
+            self.retry_at = time.monotonic() + self.delay
+            pywikibot.warning('{}; retrying in {} seconds.'
+                              .format(e, self.delay))
+            return False
+
+        self.delay = 0
+        self.since = time.monotonic()
+        return not self.entries
+
+
+class AsyncNewUserPoller:
+
+    """Retrieve new users with overlapping API queries.
+
+    The newusers log is read with one request; user info and talk page
+    existence are then requested concurrently in batches and each batch
+    is yielded as soon as both of its queries have returned.
+
+    Requests are made by pywikibot in a thread pool, so they share the
+    bot's session, login cookies and throttle. The results are attached
+    to the pywikibot objects: :class:`pywikibot.User` gets its
+    properties preloaded and the talk page existence is put into
+    ``WelcomeBot.talk_exists``.
+    """
+
+    batch_size = 50  # API limit for ususers and titles without apihighlimits
+
+    def __init__(self, bot, workers: int = 4) -> None:
+        """Initializer.
+
+        :param bot: the bot the users are retrieved for
+        :type bot: WelcomeBot
+        :param workers: number of requests running at the same time
+        """
+        self.bot = bot
+        self.site = bot.site
+        self.executor = ThreadPoolExecutor(workers)
+
+    async def _request(self, **params) -> dict:
+        """Submit an API request in the thread pool."""
+        request = self.site.simple_request(**params)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, request.submit)
+
+    async def _log_events(self, start) -> list:
+        """Return the newusers log events of this cycle."""
+        params = {'action': 'query', 'list': 'logevents',
+                  'letype': 'newusers', 'lelimit': globalvar.queryLimit}
+        if start:
+            params['lestart'] = start
+        data = await self._request(**params)
+        return data['query']['logevents']
+
+    async def _user_props(self, names) -> dict:
+        """Return user properties keyed by username."""
+        data = await self._request(
+            action='query', list='users', ususers=names,
+            usprop=['blockinfo', 'groups', 'editcount', 'registration'])
+        return {props['name']: props for props in data['query']['users']}
+
+    async def _talk_pages(self, names) -> dict:
+        """Return whether the user talk pages exist keyed by username."""
+        titles = [self.site.namespaces[3].custom_prefix() + name
+                  for name in names]
+        data = await self._request(action='query', prop='info',
+                                   titles=titles)
+        exists = {}
+        for page in data['query']['pages'].values():
+            name = page['title'].partition(':')[2]
+            exists[name] = 'missing' not in page and 'invalid' not in page
+        return exists
+
+    async def _check(self, names) -> List[pywikibot.User]:
+        """Load user properties and talk pages of one batch."""
+        props, exists = await asyncio.gather(self._user_props(names),
+                                             self._talk_pages(names))
+        users = []
+        for name in names:
+            if 'userid' not in props.get(name, {}):  # missing or invalid
+                continue
+            user = pywikibot.User(self.site, name)
+            user._userprops = props[name]
+            self.bot.talk_exists[user.username] = exists.get(name)
+            users.append(user)
+        return users
+
+    async def poll(self, start=None):
+        """Yield new users as soon as their batch has been checked."""
+        names = []
+        auto = {}  # username: user ID
+        for event in await self._log_events(start):
+            if event['action'] == 'create' \
+               or event['action'] == 'autocreate' and globalvar.welcomeAuto:
+                if 'title' not in event:  # hidden by suppression
+                    continue
+                userid = event.get('params', {}).get('userid')
+                if userid in self.bot.seen:
+                    continue
+                names.append(event['title'].partition(':')[2])
+                if event['action'] == 'autocreate':
+                    auto[names[-1]] = userid
+
+        if auto and self.bot.sul_filter:
+            loop = asyncio.get_running_loop()
+            dropped = await loop.run_in_executor(
+                self.executor, self.bot.drop_global_accounts, auto)
+            names = [name for name in names if name not in dropped]
+
+        tasks = [asyncio.ensure_future(
+            self._check(names[i:i + self.batch_size]))
+            for i in range(0, len(names), self.batch_size)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                for user in await task:
+                    yield user
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def users(self, start=None) -> Generator[pywikibot.User, None, None]:
+        """Run one poll cycle and yield the new users synchronously."""
+        loop = asyncio.new_event_loop()
+        agen = self.poll(start)
+        try:
+            while True:
+                try:
+                    user = loop.run_until_complete(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield user
+        finally:
+            loop.run_until_complete(agen.aclose())
+            loop.close()
+
+
+class EventLog:
+
+    """Buffered log of the bot's decisions as JSON lines.
+
+    Each line is one event with the user, the decision, its reason and
+    the time spent in each stage. Events below the log level are
+    dropped before they are serialized.
+    """
+
+    levels = {'debug': 10, 'info': 20, 'warning': 30}
+
+    def __init__(self, filename: str, level: str = 'info',
+                 buffer_size: int = 100) -> None:
+        """Initializer.
+
+        :param filename: file the events are appended to
+        :param level: lowest level to be logged
+        :param buffer_size: number of events written at once
+        """
+        self.filename = filename
+        self.level = self.levels[level]
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def enabled(self, level: str) -> bool:
+        """Return whether events of that level are logged."""
+        return self.levels[level] >= self.level
+
+    def emit(self, level: str, **event) -> None:
+        """Queue an event and write the buffer when it is full."""
+        if not self.enabled(level):
+            return
+        event['level'] = level
+        self.buffer.append(json.dumps(event, ensure_ascii=False))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the queued events."""
+        if not self.buffer:
+            return
+        with open(self.filename, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(self.buffer) + '\n')
+        self.buffer.clear()
+
+
+class GlobalAccountFilter:
+
+    """Pre-filter auto-created users by their global account.
+
+    Locked global accounts, global bots and global accounts older than
+    a given age are dropped before any local check. ``globaluserinfo``
+    takes one user per request, so the lookups run concurrently and
+    their verdicts are cached for a while. The filter is only used with
+    a maximum age; otherwise the local checks catch locked accounts and
+    bots without the extra requests.
+    """
+
+    def __init__(self, site, max_age: int = 0, ttl: int = 86400,
+                 workers: int = 8) -> None:
+        """Initializer.
+
+        :param max_age: maximum age in days of the global account;
+            0 means no limit
+        :param ttl: seconds a verdict is reused
+        :param workers: number of requests running at the same time
+        """
+        self.site = site
+        self.max_age = timedelta(days=max_age) if max_age else None
+        self.ttl = ttl
+        self.cache = {}  # username: (expiry, reason)
+        self.executor = ThreadPoolExecutor(workers)
+
+    def _reason(self, name: str):
+        """Return why the global account is dropped, or None."""
+        request = self.site.simple_request(action='query',
+                                           meta='globaluserinfo',
+                                           guiuser=name, guiprop='groups')
+        try:
+            info = request.submit()['query']['globaluserinfo']
+        except APIError as error:
+            pywikibot.warning('Global account of {} not checked: {}'
+                              .format(name, error))
+            return None
+
+        if 'missing' in info:
+            return None
+        if info.get('locked', False) is not False:
+            return 'globally locked'
+        if 'global-bot' in info.get('groups', []):
+            return 'global bot'
+        if self.max_age and 'registration' in info:
+            registered = pywikibot.Timestamp.fromISOformat(
+                info['registration'])
+            if pywikibot.Timestamp.utcnow() - registered > self.max_age:
+                return 'old global account'
+        return None
+
+    def drop(self, names) -> dict:
+        """Return the reasons to drop users keyed by username.
+
+        :type names: list of str
+        """
+        now = time.monotonic()
+        unknown = [name for name in names
+                   if self.cache.get(name, (0, None))[0] <= now]
+        for name, reason in zip(unknown,
+                                self.executor.map(self._reason, unknown)):
+            self.cache[name] = (now + self.ttl, reason)
+        if len(self.cache) > 10000:
+            self.cache = {name: entry for name, entry in self.cache.items()
+                          if entry[0] > now}
+        return {name: self.cache[name][1] for name in names
+                if self.cache[name][1]}
+
+
+class RecheckScheduler:
+
+    """Users below the edit count threshold waiting to be checked again.
+
+    Each user is checked again after the intervals of :attr:`intervals`
+    in turn and dropped after the last one. The pending checks are kept
+    in a heap ordered by due time and saved to a file between runs.
+    """
+
+    intervals = (3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600)
+
+    def __init__(self, filename: str) -> None:
+        """Initializer.
+
+        :param filename: file where pending checks are stored
+        """
+        self.filename = filename
+        self.heap = []  # (due time, username, stage)
+        self.pending = {}  # username: stage
+        with suppress(FileNotFoundError), \
+                codecs.open(filename, 'r', encoding='utf-8') as f:
+            for due, name, stage in json.load(f):
+                self.pending[name] = stage
+                self.heap.append((due, name, stage))
+        heapq.heapify(self.heap)
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def schedule(self, name: str, stage: int = 0) -> None:
+        """Schedule the next check of a user unless it is pending.
+
+        :param name: username
+        :param stage: number of checks already done after the first one
+        """
+        if name in self.pending:
+            return
+        if stage >= len(self.intervals):
+            pywikibot.log('{} expired from the re-check schedule.'
+                          .format(name))
+            return
+        self.pending[name] = stage
+        heapq.heappush(self.heap,
+                       (time.time() + self.intervals[stage], name, stage))
+
+    def discard(self, name: str) -> None:
+        """Forget a user which does not need to be checked again."""
+        self.pending.pop(name, None)
+
+    def pop_due(self) -> List[tuple]:
+        """Remove and return (username, stage) of all due checks."""
+        now = time.time()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, name, stage = heapq.heappop(self.heap)
+            # skip entries which were discarded or superseded
+            if self.pending.get(name) == stage:
+                del self.pending[name]
+                due.append((name, stage))
+        return due
+
+    def save(self) -> None:
+        """Save the pending checks."""
+        entries = [entry for entry in self.heap
+                   if self.pending.get(entry[1]) == entry[2]]
+        with codecs.open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+
+
+class SeenUserIndex:
+
+    """Compact set of the IDs of users which have been decided.
+
+    The IDs are kept as sorted disjoint ranges in two integer arrays.
+    User IDs are given out in order of signup, so runs of decided users
+    collapse into one range and a year of signups takes little memory.
+    """
+
+    def __init__(self, filename: str) -> None:
+        """Initializer.
+
+        :param filename: file where the ranges are stored
+        """
+        self.filename = filename
+        self.starts = array('q')
+        self.ends = array('q')  # inclusive
+        with suppress(FileNotFoundError), open(filename, 'rb') as f:
+            ranges = array('q')
+            ranges.frombytes(f.read())
+            half = len(ranges) // 2
+            self.starts, self.ends = ranges[:half], ranges[half:]
+
+    def __len__(self) -> int:
+        """Return the number of ranges."""
+        return len(self.starts)
+
+    def __contains__(self, userid) -> bool:
+        if userid is None:  # hidden or missing in the log entry
+            return False
+        i = bisect.bisect_right(self.starts, userid) - 1
+        return i >= 0 and userid <= self.ends[i]
+
+    def add(self, userid: int) -> None:
+        """Add a user ID, merging it with adjacent ranges."""
+        i = bisect.bisect_right(self.starts, userid) - 1
+        if i >= 0 and userid <= self.ends[i]:
+            return
+        after_left = i >= 0 and self.ends[i] == userid - 1
+        before_right = (i + 1 < len(self.starts)
+                        and self.starts[i + 1] == userid + 1)
+        if after_left and before_right:
+            self.ends[i] = self.ends[i + 1]
+            del self.starts[i + 1]
+            del self.ends[i + 1]
+        elif after_left:
+            self.ends[i] = userid
+        elif before_right:
+            self.starts[i + 1] = userid
+        else:
+            self.starts.insert(i + 1, userid)
+            self.ends.insert(i + 1, userid)
+
+    def save(self) -> None:
+        """Save the ranges."""
+        with open(self.filename, 'wb') as f:
+            self.starts.tofile(f)
+            self.ends.tofile(f)
+
+
+class SignaturePool:
+
+    """Signatures used in rotation, cached with the version they came from.
+
+    The parsed list is stored on disk with the revision ID of the
+    signature page or the modification time of the signature file, and
+    is parsed again only if that version changed. The signatures are
+    shuffled once per version and then used in turn, so that with a
+    saved rotation index they are spread evenly across restarts.
+    """
+
+    regex = re.compile(r'^\* ?(.*?)\r?$', re.M)
+
+    def __init__(self, filename: str) -> None:
+        """Initializer.
+
+        :param filename: file where the pool is cached
+        """
+        self.filename = filename
+        self.source = None
+        self.version = None
+        self.signatures = []
+        self.index = 0
+        with suppress(FileNotFoundError, ValueError), \
+                codecs.open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            self.source = data['source']
+            self.version = data['version']
+            self.signatures = data['signatures']
+            self.index = data['index']
+
+    def _update(self, source: str, version, signatures) -> None:
+        """Replace the signatures."""
+        random.shuffle(signatures)
+        self.source, self.version = source, version
+        self.signatures = signatures
+        self.index = 0
+
+    def load_page(self, page) -> bool:
+        """Load the signatures from a page if it was edited.
+
+        :return: whether the signatures changed
+        :raises NoPageError: the page does not exist
+        """
+        source = 'page:' + page.title()
+        request = page.site.simple_request(action='query', prop='info',
+                                           titles=page.title())
+        pages = request.submit()['query']['pages']
+        if isinstance(pages, dict):
+            pages = pages.values()
+        version = next(iter(pages)).get('lastrevid')
+        if version is None:
+            raise NoPageError(page)
+        if (source, version) == (self.source, self.version):
+            return False
+
+        pywikibot.output('Loading signature list...')
+        self._update(source, version, self.regex.findall(page.get()))
+        return True
+
+    def load_file(self, filename: str, encoding: str) -> bool:
+        """Load the signatures from a file if it was modified.
+
+        The file is memory-mapped instead of read into a string.
+
+        :return: whether the signatures changed
+        :raises OSError: the file cannot be read
+        """
+        source = 'file:' + filename
+        stat = os.stat(filename)
+        version = [stat.st_mtime_ns, stat.st_size]
+        if (source, version) == (self.source, self.version):
+            return False
+
+        signatures = []
+        if stat.st_size:
+            pattern = re.compile(self.regex.pattern.encode(), re.M)
+            with open(filename, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                signatures = [match.decode(encoding)
+                              for match in pattern.findall(data)]
+        self._update(source, version, signatures)
+        return True
+
+    def next(self) -> str:
+        """Return the next signature of the rotation."""
+        signature = self.signatures[self.index % len(self.signatures)]
+        self.index += 1
+        return signature
+
+    def save(self, index: bool = True) -> None:
+        """Save the pool.
+
+        :param index: whether the rotation continues from the current
+            position on the next run instead of a random one
+        """
+        with codecs.open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump({'source': self.source, 'version': self.version,
+                       'signatures': self.signatures,
+                       'index': self.index if index else None}, f,
+                      ensure_ascii=False)
+
+
+class BackfillScanner:
+
+    """Retrieve the new users of a past time range.
+
+    The range is split into shards which are scanned concurrently; the
+    users are then yielded shard by shard in chronological order. A
+    shard is checkpointed once all its users have been treated, so an
+    interrupted backfill resumes with the first unfinished shard.
+    """
+
+    def __init__(self, bot, start, end, shard_hours: int = 24,
+                 workers: int = 4) -> None:
+        """Initializer.
+
+        :param bot: the bot the users are retrieved for
+        :type bot: WelcomeBot
+        :param start: oldest timestamp of the range
+        :type start: pywikibot.Timestamp
+        :param end: newest timestamp of the range; if None, the end of
+            an interrupted backfill with the same start, otherwise the
+            current server time
+        :type end: pywikibot.Timestamp or None
+        :param shard_hours: length of a shard
+        :param workers: number of shards scanned at the same time
+        """
+        self.bot = bot
+        self.site = bot.site
+        self.start = start
+        self.shard_hours = shard_hours
+        self.shard_length = timedelta(hours=shard_hours)
+        self.workers = workers
+        self.filename = pywikibot.config.datafilepath(
+            'welcome-backfill-{}-{}.json'.format(self.site.family.name,
+                                                 self.site.code))
+        self.done = set()
+        with suppress(FileNotFoundError), \
+                codecs.open(self.filename, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+            saved_start, saved_end = checkpoint['range']
+            # the shards only match if they are cut the same way
+            if saved_start == start.totimestampformat() \
+               and checkpoint.get('shard_hours') == shard_hours \
+               and (end is None or saved_end == end.totimestampformat()):
+                self.done = set(checkpoint['done'])
+                # an open-ended range resumes with its resolved end
+                end = pywikibot.Timestamp.fromtimestampformat(saved_end)
+        self.end = end or self.site.server_time()
+
+    def shards(self) -> list:
+        """Return the (start, end) timestamps of all shards."""
+        shards = []
+        start = self.start
+        while start < self.end:
+            end = min(start + self.shard_length, self.end)
+            shards.append((start, end))
+            start = end
+        return shards
+
+    def scan(self, start, end) -> list:
+        """Return the new users of one shard, oldest first.
+
+        :return: username, user ID and whether the account was
+            auto-created, for each user
+        """
+        accounts = []
+        for ue in self.site.logevents('newusers', start=start, end=end,
+                                      reverse=True):
+            if ue.action() == 'create' \
+               or ue.action() == 'autocreate' and globalvar.welcomeAuto:
+                try:
+                    name = ue.page().username
+                except HiddenKeyError:
+                    pywikibot.exception()
+                    continue
+                accounts.append((name,
+                                 ue.data.get('params', {}).get('userid'),
+                                 ue.action() == 'autocreate'))
+        return accounts
+
+    def new_users(self, accounts) -> List[pywikibot.User]:
+        """Return the users of a shard which have not been decided yet.
+
+        Auto-created users are dropped by their global accounts like
+        on a regular poll.
+        """
+        accounts = [account for account in accounts
+                    if account[1] not in self.bot.seen]
+        auto = {name: userid for name, userid, autocreated in accounts
+                if autocreated}
+        dropped = {}
+        if auto and self.bot.sul_filter:
+            dropped = self.bot.drop_global_accounts(auto)
+        return [pywikibot.User(self.site, name) for name, _, _ in accounts
+                if name not in dropped]
+
+    def checkpoint(self, start) -> None:
+        """Mark the shard beginning at *start* as done."""
+        self.done.add(start.totimestampformat())
+        with codecs.open(self.filename, 'w', encoding='utf-8') as f:
+            json.dump({'range': [self.start.totimestampformat(),
+                                 self.end.totimestampformat()],
+                       'shard_hours': self.shard_hours,
+                       'done': sorted(self.done)}, f)
+
+    def users(self) -> Generator[pywikibot.User, None, None]:
+        """Yield the new users of all unfinished shards in order."""
+        shards = [shard for shard in self.shards()
+                  if shard[0].totimestampformat() not in self.done]
+        pywikibot.output('Backfilling {} of {} shards from {} to {}...'
+                         .format(len(shards), len(self.shards()),
+                                 self.start, self.end))
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = [executor.submit(self.scan, *shard)
+                       for shard in shards]
+            for (start, end), future in zip(shards, futures):
+                users = self.new_users(future.result())
+                self.bot.preload_users(users)
+                yield from users
+                self.checkpoint(start)
+
+        with suppress(FileNotFoundError):
+            os.remove(self.filename)
+
+
+class NameVerdict(NamedTuple):
+
+    """Result of screening a username."""
+
+    name: str
+    bad_words: List[str]
+
+    @property
+    def bad(self) -> bool:
+        """Whether the username contains a bad word."""
+        return bool(self.bad_words)
+
+
+class BadNameMatcher:
+
+    """Precompiled bad words list and whitelist.
+
+    Whitelisted words are removed from a username before it is matched.
+    All bad words are combined into one regex, built as a trie to avoid
+    backtracking over hundreds of alternatives, which rejects clean
+    names in a single pass; only names which match are compared with
+    every bad word to find all of them.
+    """
+
+    chunk_size = 10000  # names per worker task
+    pool_threshold = 100000  # inputs from this size use a process pool
+
+    def __init__(self, blacklist, whitelist) -> None:
+        """Initializer.
+
+        :param blacklist: bad words
+        :type blacklist: list of str
+        :param whitelist: words which are allowed in usernames
+        :type whitelist: list of str
+        """
+        self.blacklist = [(word, word.lower()) for word in blacklist]
+        self.whitelist = [word.lower() for word in whitelist]
+        self.regex = re.compile(
+            self._trie_pattern(lower for _, lower in self.blacklist))
+
+    @staticmethod
+    def _trie_pattern(words) -> str:
+        """Return a regex pattern matching any of the words."""
+        trie = {}
+        for word in words:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        def build(node) -> str:
+            alternatives = [re.escape(char) + build(child)
+                            for char, child in sorted(node.items()) if char]
+            if not alternatives:
+                return ''
+            if len(alternatives) == 1:
+                pattern = alternatives[0]
+            else:
+                pattern = '(?:{})'.format('|'.join(alternatives))
+            if '' in node:  # a word ends here
+                pattern = '(?:{})?'.format(pattern)
+            return pattern
+
+        return build(trie) if trie else '(?!)'
+
+    def match(self, name: str) -> List[str]:
+        """Return the bad words contained in a username."""
+        name = str(name).lower()
+        for wname in self.whitelist:
+            if wname in name:
+                name = name.replace(wname, '')
+        if not self.regex.search(name):
+            return []
+        return [word for word, lower in self.blacklist if lower in name]
+
+    def _screen(self, names) -> List[NameVerdict]:
+        """Screen usernames in this process."""
+        return [NameVerdict(name, self.match(name)) for name in names]
+
+    def screen(self, names, processes=None) -> List[NameVerdict]:
+        """Screen usernames, using a process pool for large inputs.
+
+        :param names: usernames to be screened
+        :type names: list of str
+        :param processes: number of worker processes, default is the
+            number of CPUs
+        :type processes: int or None
+        :return: verdicts in the order of *names*
+        """
+        names = list(names)
+        if len(names) < self.pool_threshold or processes == 1:
+            return self._screen(names)
+
+        chunks = [names[i:i + self.chunk_size]
+                  for i in range(0, len(names), self.chunk_size)]
+        with ProcessPoolExecutor(processes) as executor:
+            return [verdict for verdicts in executor.map(self._screen, chunks)
+                    for verdict in verdicts]
 
 
 class WelcomeBot(SingleSiteBot):
 
     """Bot to add welcome messages on User pages."""
 
-    def __init__(self, **kwargs) -> None:
-        """Initializer."""
+    subst_regex = re.compile(r'\{\{\s*subst:\s*([^{}|]+?)\s*(\|[^{}]*)?\}\}')
+    # stands in for the username while a template is expanded
+    expand_user = 'Welcome3 placeholder user'
+
+    def __init__(self, edit_budget=None, **kwargs) -> None:
+        """Initializer.
+
+        :param edit_budget: edit rate budget shared with other bots
+        :type edit_budget: EditBudget
+        """
         super().__init__(**kwargs)
         self.check_managed_sites()
         self.bname = {}
-
-        self.welcomed_users = []
+        self.edit_budget = edit_budget
+        self.talk_exists = {}
+        self.request_memo = None
+        self._reported = None
+        self.seen = SeenUserIndex(pywikibot.config.datafilepath(
+            'welcome-seen-{}-{}.dat'.format(self.site.family.name,
+                                            self.site.code)))
+        self.rechecks = None
+        self.recheck_stage = {}
+        if globalvar.recheckUsers:
+            self.rechecks = RecheckScheduler(pywikibot.config.datafilepath(
+                'welcome-recheck-{}-{}.json'.format(self.site.family.name,
+                                                    self.site.code)))
+        self.async_poller = None
+        if globalvar.asyncPoll:
+            self.async_poller = AsyncNewUserPoller(self)
+        self.sul_filter = None
+        # one request per user; only worth it if it can drop old accounts
+        if globalvar.welcomeAuto and globalvar.sulAge:
+            self.sul_filter = GlobalAccountFilter(self.site, globalvar.sulAge)
+        self.event_log = None
+        if globalvar.eventLog:
+            self.event_log = EventLog(
+                pywikibot.config.datafilepath(globalvar.eventLog.format(
+                    family=self.site.family.name, code=self.site.code)),
+                globalvar.logLevel)
+        self.timings = {}
+        self._stage_start = 0.0
+
+        self.welcomed_users = FlushQueue(self.makelogpage,
+                                         globalvar.dumpToLog,
+                                         globalvar.dumpAge)
+        self._BAQueue = FlushQueue(self.report_bad_account,
+                                   globalvar.dumpToLog, globalvar.dumpAge)
         self.log_name = i18n.translate(self.site, logbook)
 
-        if not self.log_name:
-            globalvar.makeWelcomeLog = False
-        if globalvar.randomSign:
+        # per site copies; several bots may share globalvar
+        self.make_welcome_log = globalvar.makeWelcomeLog and bool(
+            self.log_name)
+        self.random_sign = globalvar.randomSign
+        self.sign_pool = None
+        if self.random_sign:
+            self.sign_pool = SignaturePool(pywikibot.config.datafilepath(
+                'welcome-signs-{}-{}.json'.format(self.site.family.name,
+                                                  self.site.code)))
+            if self.sign_pool.index is None:
+                self.sign_pool.index = random.randrange(1 << 16)
             self.defineSign(True)
 
     def check_managed_sites(self) -> None:
@@ -176,13 +1088,131 @@ class WelcomeBot(SingleSiteBot):
             raise KeyError(
                 'welcome.py is not localized for site {} in netext dict.'
                 .format(self.site))
-        self.welcome_text = site_netext
+        self.site_netext = self.welcome_text = site_netext
+        self.expanded_revids = None
+        self.final_text = i18n.translate(self.site, final_new_text_additions)
+        self._rendered = {}
+
+    def refresh_welcome_text(self) -> None:
+        """Substitute the templates of the welcome text in advance.
+
+        The templates are substituted once for a placeholder user with
+        the pre-save transform of the server, which gives the same text
+        as substituting them on save, and again only if one of them has
+        been edited since. A template which signs the message is left
+        to the server, otherwise every welcome would get the same
+        signature timestamp.
+        """
+        calls = list(self.subst_regex.finditer(self.site_netext))
+        if not calls:
+            return
+
+        titles = [pywikibot.Page(self.site, call[1], ns=10).title()
+                  for call in calls]
+        request = self.site.simple_request(action='query', prop='revisions',
+                                           rvprop='ids|content',
+                                           rvslots='main', titles=titles,
+                                           formatversion=2)
+        pages = request.submit()['query']['pages']
+        revisions = {page['title']: page['revisions'][0]
+                     for page in pages if 'revisions' in page}
+        key = tuple(revisions[title]['revid'] if title in revisions else None
+                    for title in titles)
+        if key == self.expanded_revids:
+            return
+
+        welcome_text = self.site_netext
+        if None in key:
+            pywikibot.warning('A welcome template does not exist; it will '
+                              'be substituted by the server.')
+        elif any('~~~' in revision['slots']['main']['content']
+                 for revision in revisions.values()):
+            pywikibot.warning('A welcome template contains a signature; it '
+                              'will be substituted by the server.')
+        else:
+            talk_title = pywikibot.Page(self.site, self.expand_user,
+                                        ns=3).title()
+            try:
+                for call in reversed(calls):
+                    request = self.site.simple_request(
+                        action='parse', text=call[0], title=talk_title,
+                        contentmodel='wikitext', onlypst=True,
+                        formatversion=2)
+                    expanded = request.submit()['parse']['text']
+                    welcome_text = (welcome_text[:call.start()]
+                                    + expanded.replace('%', '%%')
+                                    + welcome_text[call.end():])
+            except APIError as error:
+                pywikibot.warning('Could not substitute the welcome '
+                                  'template: {}'.format(error))
+                return
+            pywikibot.log('Substituted the welcome templates at revisions '
+                          '{}.'.format(', '.join(map(str, key))))
+
+        self.welcome_text = welcome_text
+        self.expanded_revids = key
+        self._rendered.clear()
+
+    def personalize(self, text: str, user) -> str:
+        """Put the username into a pre-substituted welcome message."""
+        if self.welcome_text is self.site_netext:
+            return text
+        return text.replace(self.expand_user, user.username).replace(
+            self.expand_user.replace(' ', '_'),
+            user.title(as_url=True, with_ns=False))
+
+    def welcome_message(self, sign: str) -> str:
+        """Return the welcome message with the given signature.
+
+        The message is rendered once per signature and then looked up.
+        The cache is cleared when the welcome text or the signature list
+        is loaded again.
+        """
+        key = (self.random_sign, sign)
+        if key in self._rendered:
+            return self._rendered[key]
+
+        welcome_text = self.welcome_text
+        if self.random_sign:
+            if self.site.family.name != 'wikinews':
+                welcome_text = welcome_text % sign
+            if self.site.sitename != 'wiktionary:it':
+                welcome_text += timeselected
+        elif self.site.sitename != 'wikinews:it':
+            welcome_text = welcome_text % sign
+
+        if self.final_text:
+            welcome_text += self.final_text
+        self._rendered[key] = welcome_text
+        return welcome_text
 
     def badNameFilter(self, name, force=False) -> bool:
         """Check for bad names."""
         if not globalvar.filtBadName:
             return False
 
+        with suppress(UnicodeEncodeError):
+            bad_words = self.name_matcher(force).match(name)
+            if bad_words:  # bad name positive
+                self.bname[name] = bad_words[0]
+                return True
+        return False
+
+    def screen_usernames(self, names, processes=None) -> List[NameVerdict]:
+        """Screen many usernames against the bad words list at once.
+
+        This does not depend on the -filter option and does not modify
+        :attr:`bname`.
+
+        :param names: usernames to be screened
+        :type names: list of str
+        :param processes: number of worker processes for large inputs
+        :type processes: int or None
+        """
+        return self.name_matcher().screen(names, processes)
+
+    def name_matcher(self, force=False) -> BadNameMatcher:
+        """Load the bad words list and whitelist into a matcher."""
         # initialize blacklist
         if not hasattr(self, '_blacklist') or force:
             elenco = [
@@ -227,13 +1257,17 @@ class WelcomeBot(SingleSiteBot):
                                           i18n.translate(self.site,
                                                          bad_pag))
             list_loaded = []
-            if badword_page.exists():
-                pywikibot.output('\nLoading the bad words list from {}...'
-                                 .format(self.site))
-                list_loaded = load_word_function(badword_page.get())
-            else:
+            # get() loads the page info too, exists() would be one more
+            # request
+            try:
+                text = badword_page.get()
+            except NoPageError:
                 self.show_status(Msg.WARN)
                 pywikibot.output("The bad word page doesn't exist!")
+            else:
+                pywikibot.output('\nLoading the bad words list from {}...'
+                                 .format(self.site))
+                list_loaded = load_word_function(text)
             self._blacklist = elenco + elenco_others + list_loaded
             del elenco, elenco_others, list_loaded
 
@@ -244,13 +1278,15 @@ class WelcomeBot(SingleSiteBot):
             list_white = []
             if wtlpg:
                 whitelist_page = pywikibot.Page(self.site, wtlpg)
-                if whitelist_page.exists():
-                    pywikibot.output('\nLoading the whitelist from {}...'
-                                     .format(self.site))
-                    list_white = load_word_function(whitelist_page.get())
-                else:
+                try:
+                    text = whitelist_page.get()
+                except NoPageError:
                     self.show_status(Msg.WARN)
                     pywikibot.output("The whitelist's page doesn't exist!")
+                else:
+                    pywikibot.output('\nLoading the whitelist from {}...'
+                                     .format(self.site))
+                    list_white = load_word_function(text)
             else:
                 self.show_status(Msg.WARN)
                 pywikibot.warning("The whitelist hasn't been set!")
@@ -259,18 +1295,9 @@ class WelcomeBot(SingleSiteBot):
             self._whitelist = list_white + whitelist_default
             del list_white, whitelist_default
 
-        with suppress(UnicodeEncodeError):
-            for wname in self._whitelist:
-                if wname.lower() in str(name).lower():
-                    name = name.lower().replace(wname.lower(), '')
-                    for bname in self._blacklist:
-                        self.bname[name] = bname
-                        return bname.lower() in name.lower()
-            for bname in self._blacklist:
-                if bname.lower() in str(name).lower():  # bad name positive
-                    self.bname[name] = bname
-                    return True
-        return False
+        if not hasattr(self, '_matcher') or force:
+            self._matcher = BadNameMatcher(self._blacklist, self._whitelist)
+        return self._matcher
 
     def collect_bad_accounts(self, name: str) -> None:
         """Add bad account to queue."""
@@ -287,39 +1314,70 @@ class WelcomeBot(SingleSiteBot):
             answer = 'y'
 
         if answer.lower() in ['yes', 'y'] or not globalvar.confirm:
-            self.show_status()
-            pywikibot.output(
-                '{} is possibly an unwanted username. It will be reported.'
-                .format(name))
-            if hasattr(self, '_BAQueue'):
-                self._BAQueue.append(name)
-            else:
-                self._BAQueue = [name]
+            if globalvar.console:
+                self.show_status()
+                pywikibot.output(
+                    '{} is possibly an unwanted username. It will be '
+                    'reported.'.format(name))
+            self._BAQueue.append(name)
 
-        if len(self._BAQueue) >= globalvar.dumpToLog:
-            self.report_bad_account()
+        self._BAQueue.flush_due()
 
-    def report_bad_account(self) -> None:
-        """Report bad account."""
+    @property
+    def reported_filename(self) -> str:
+        """File where the reported usernames are kept between runs."""
+        return pywikibot.config.datafilepath(
+            'welcome-reported-{}-{}.txt'.format(self.site.family.name,
+                                                self.site.code))
+
+    def reported_accounts(self, rep_page) -> Set[str]:
+        """Return the usernames which have been reported already.
+
+        The report page is parsed only once per run, later reports are
+        added to the returned set by :meth:`report_bad_account`.
+        """
+        if self._reported is not None:
+            return self._reported
+
+        self._reported = set()
+        with suppress(FileNotFoundError), \
+                open(self.reported_filename, encoding='utf-8') as f:
+            self._reported.update(line.rstrip('\n') for line in f)
+
+        try:
+            text = rep_page.get()
+        except NoPageError:
+            return self._reported
+
+        # Only the part around the username is used; the timestamp
+        # after it has been expanded when the entry was saved.
+        head, _, tail = i18n.translate(self.site,
+                                       report_text).partition('%s')
+        tail = tail.split('~~~')[0].strip()
+        regex = re.compile(re.escape(head.strip()) + '(.+?)'
+                           + (re.escape(tail) if tail else '$'), re.M)
+        self._reported.update(name.strip() for name in regex.findall(text))
+        return self._reported
+
+    def report_bad_account(self, names) -> None:
+        """Report bad account.
+
+        :param names: usernames to be reported
+        :type names: list of str
+        """
         rep_text = ''
         # name in queue is max, put detail to report page
         pywikibot.output('Updating badname accounts to report page...')
         rep_page = pywikibot.Page(self.site,
                                   i18n.translate(self.site,
                                                  report_page))
-        if rep_page.exists():
-            text_get = rep_page.get()
-        else:
-            text_get = ('This is a report page for the Bad-username, '
-                        'please translate me. ~~~')
-        pos = 0
+        reported = self.reported_accounts(rep_page)
+        new_names = []
         # The talk page includes "_" between the two names, in this way
         # replace them to " ".
-        for usrna in self._BAQueue:
+        for usrna in names:
             username = pywikibot.url2link(usrna, self.site, self.site)
-            n = re.compile(re.escape(username))
-            y = n.search(text_get, pos)
-            if y:
+            if username in reported or username in new_names:
                 pywikibot.output('{} is already in the report page.'
                                  .format(username))
             else:
@@ -328,18 +1386,30 @@ class WelcomeBot(SingleSiteBot):
                                            report_text) % username
                 if self.site.code == 'it':
                     rep_text = '%s%s}}' % (rep_text, self.bname[username])
+                new_names.append(username)
 
         com = 'Bot: Thêm một tên người dùng cần được kiểm tra'
         if rep_text != '':
-            rep_page.put(text_get + rep_text, summary=com, force=True,
-                         minor=True)
+            if not rep_page.exists():
+                rep_text = ('This is a report page for the Bad-username, '
+                            'please translate me. ~~~' + rep_text)
+            # append only the new entries, the page is not sent back
+            rep_page.save(summary=com, force=True, minor=True,
+                          appendtext=rep_text)
+            # only now, a failed save is retried with the same names
+            reported.update(new_names)
+            with open(self.reported_filename, 'a', encoding='utf-8') as f:
+                f.writelines(name + '\n' for name in new_names)
             self.show_status(Msg.DONE)
             pywikibot.output('Reported')
-        self.BAQueue = []
 
-    def makelogpage(self):
-        """Make log page."""
-        if not globalvar.makeWelcomeLog or not self.welcomed_users:
+    def makelogpage(self, users) -> None:
+        """Make log page.
+
+        :param users: url encoded usernames and edit counts to be logged
+        :type users: list of tuple
+        """
+        if not self.make_welcome_log or not users:
             return
 
         if self.site.code == 'it':
@@ -350,9 +1420,8 @@ class WelcomeBot(SingleSiteBot):
             pattern, time.localtime(time.time()))
 
         log_page = pywikibot.Page(self.site, target)
-        if log_page.exists():
-            text = log_page.get()
-        else:
+        text = ''
+        if not log_page.exists():
             # make new log page
             self.show_status()
             pywikibot.output(
@@ -365,43 +1434,179 @@ class WelcomeBot(SingleSiteBot):
 
         # Adding the log... (don't take care of the variable's name...).
         text += '\n'
-        text += '\n'.join(
-            '{{WLE|user=%s|contribs=%d}}' % (
-                user.title(as_url=True, with_ns=False), user.editCount())
-            for user in self.welcomed_users)
-
-        # update log page.
-        while True:
-            try:
-                log_page.put(text, 'Bot: Cập nhật nhật trình')
-            except EditConflictError:
-                pywikibot.output('An edit conflict has occurred. Pausing for '
-                                 '10 seconds before continuing.')
-                time.sleep(10)
-            else:
-                break
-        self.welcomed_users = []
-
-    @property
-    def generator(self) -> Generator[pywikibot.User, None, None]:
-        """Retrieve new users."""
-        while True:
-            if globalvar.timeoffset != 0:
-                start = self.site.server_time() - timedelta(
-                    minutes=globalvar.timeoffset)
-            else:
-                start = globalvar.offset
+        text += '\n'.join('{{WLE|user=%s|contribs=%d}}' % user
+                          for user in users)
+
+        # update log page; appending neither reads the page text nor
+        # conflicts with other edits. The page belongs to the bot, so
+        # the {{bots}} check, another read, is skipped.
+        log_page.save(summary='Bot: Cập nhật nhật trình', force=True,
+                      appendtext=text)
+
+    def setup(self) -> None:
+        """Adapt the request rates to the server load."""
+        super().setup()
+        AdaptiveThrottle.install(self.site)
+        self.request_memo = RequestMemo.install()
+
+    def start(self) -> None:
+        """Start the run statistics and set up the bot like run() does.
+
+        Used if the cycles are driven from outside, see
+        :class:`MultiSiteWelcomeRunner`.
+        """
+        self._start_ts = pywikibot.Timestamp.now()
+        self.setup()
+
+    def poll_new_users(self) -> Generator[pywikibot.User, None, None]:
+        """Retrieve new users once."""
+        # entries of skipped users are never popped by treat()
+        self.talk_exists.clear()
+        if self.request_memo:
+            self.request_memo.clear()
+        if globalvar.expandTemplates:
+            self.refresh_welcome_text()
+        if self.random_sign:
+            self.defineSign(True)  # revalidate the signature list
+        if globalvar.timeoffset != 0:
+            start = self.site.server_time() - timedelta(
+                minutes=globalvar.timeoffset)
+        else:
+            start = globalvar.offset
+        if self.async_poller:
+            yield from self.async_poller.users(start)
+        else:
+            users = []
+            auto = {}  # username: user ID
             for ue in self.site.logevents('newusers',
                                           total=globalvar.queryLimit,
                                           start=start):
                 if ue.action() == 'create' \
                    or ue.action() == 'autocreate' and globalvar.welcomeAuto:
+                    userid = ue.data.get('params', {}).get('userid')
+                    if userid in self.seen:
+                        continue
                     try:
                         user = ue.page()
                     except HiddenKeyError:
                         pywikibot.exception()
-                    else:
-                        yield user
+                        continue
+                    if ue.action() == 'autocreate' and self.sul_filter:
+                        auto[user.username] = userid
+                    users.append(user)
+
+            if auto:
+                dropped = self.drop_global_accounts(auto)
+                users = [user for user in users
+                         if user.username not in dropped]
+            # one request per batch instead of one per user in skip_page
+            self.preload_users(users)
+            yield from users
+
+        if self.rechecks:
+            yield from self.due_rechecks()
+
+    def stage(self, name: str) -> None:
+        """Record the time spent since the previous stage."""
+        now = time.perf_counter()
+        self.timings[name] = round((now - self._stage_start) * 1000, 2)
+        self._stage_start = now
+
+    def report(self, message, user, decision: str, reason: str, text: str,
+               *args, level: str = 'info', **fields) -> None:
+        """Report the decision about a user.
+
+        The text is formatted and shown only on interactive runs; the
+        event is written to the event log if enabled.
+
+        :param message: status header of the console output
+        :type message: Msg
+        :param text: console text; formatted with the username and args
+        :param fields: additional fields of the event
+        """
+        if globalvar.console:
+            self.show_status(message)
+            pywikibot.output(text.format(user.username, *args))
+        if self.event_log and self.event_log.enabled(level):
+            self.event_log.emit(level, time=time.time(), site=str(self.site),
+                                user=user.username, decision=decision,
+                                reason=reason, stages=self.timings, **fields)
+
+    def drop_global_accounts(self, auto) -> dict:
+        """Drop auto-created users by their global accounts.
+
+        :param auto: user IDs of the auto-created users keyed by name
+        :type auto: dict
+        :return: the reasons to drop users keyed by username
+        """
+        dropped = self.sul_filter.drop(list(auto))
+        self.timings = {}
+        for name, reason in dropped.items():
+            self.report(Msg.SKIP, pywikibot.User(self.site, name), 'skip',
+                        reason, '{} is skipped: {}.', reason)
+            if auto[name]:
+                self.seen.add(auto[name])
+        return dropped
+
+    def decided(self, user) -> None:
+        """Remember that the user needs no further checks."""
+        userid = user.getprops().get('userid')
+        if userid:
+            self.seen.add(userid)
+
+    def preload_users(self, users) -> None:
+        """Load the properties of many users with batched requests.
+
+        :type users: list of pywikibot.User
+        """
+        names = [user.username for user in users]
+        props = {}
+        for i in range(0, len(names), AsyncNewUserPoller.batch_size):
+            props.update((entry['name'], entry) for entry in self.site.users(
+                names[i:i + AsyncNewUserPoller.batch_size]))
+        for user in users:
+            if 'userid' in props.get(user.username, {}):
+                user._userprops = props[user.username]
+
+    def due_rechecks(self) -> Generator[pywikibot.User, None, None]:
+        """Yield the users whose re-check is due."""
+        due = self.rechecks.pop_due()
+        if not due:
+            return
+
+        self.show_status()
+        pywikibot.output('Checking {} users again...'.format(len(due)))
+        users = []
+        for name, stage in due:
+            self.recheck_stage[name] = stage
+            users.append(pywikibot.User(self.site, name))
+        self.preload_users(users)
+        yield from users
+
+    def run_cycle(self) -> None:
+        """Retrieve new users once, welcome them and write the logs."""
+        for user in self.poll_new_users():
+            if self.skip_page(user):
+                self.counter['skip'] += 1
+                continue
+            self.counter['read'] += 1
+            self.treat(user)
+        self.write_log()
+
+    @property
+    def generator(self) -> Generator[pywikibot.User, None, None]:
+        """Retrieve new users."""
+        if globalvar.backfill:
+            if globalvar.expandTemplates:
+                self.refresh_welcome_text()
+            start, end = globalvar.backfill
+            yield from BackfillScanner(self, start, end,
+                                       globalvar.backfillShard).users()
+            self.write_log()
+            return
+
+        while True:
+            yield from self.poll_new_users()
 
             self.write_log()
             if not globalvar.recursive:
@@ -416,11 +1621,9 @@ class WelcomeBot(SingleSiteBot):
 
     def defineSign(self, force=False) -> List[str]:
         """Setup signature."""
-        if hasattr(self, '_randomSignature') and not force:
-            return self._randomSignature
+        if not force:
+            return self.sign_pool.signatures
 
-        sign_text = ''
-        creg = re.compile(r'^\* ?(.*?)$', re.M)
         if not globalvar.signFileName:
             sign_page_name = i18n.translate(self.site, random_sign)
             if not sign_page_name:
@@ -428,104 +1631,147 @@ class WelcomeBot(SingleSiteBot):
                 pywikibot.output(
                     "{} doesn't allow random signature, force disable."
                     .format(self.site))
-                globalvar.randomSign = False
+                self.random_sign = False
                 return None
 
             sign_page = pywikibot.Page(self.site, sign_page_name)
-            if sign_page.exists():
-                pywikibot.output('Loading signature list...')
-                sign_text = sign_page.get()
-            else:
+            try:
+                changed = self.sign_pool.load_page(sign_page)
+            except NoPageError:
                 pywikibot.output('The signature list page does not exist, '
                                  'random signature will be disabled.')
-                globalvar.randomSign = False
+                self.random_sign = False
+                return []
         else:
             try:
-                f = codecs.open(
-                    pywikibot.config.datafilepath(globalvar.signFileName), 'r',
-                    encoding=config.console_encoding)
+                encoding = codecs.lookup(config.console_encoding).name
             except LookupError:
-                f = codecs.open(pywikibot.config.datafilepath(
-                    globalvar.signFileName), 'r', encoding='utf-8')
-            except IOError:
+                encoding = 'utf-8'
+            try:
+                changed = self.sign_pool.load_file(
+                    pywikibot.config.datafilepath(globalvar.signFileName),
+                    encoding)
+            except OSError:
                 pywikibot.error('No fileName!')
                 raise FilenameNotSet('No signature filename specified.')
 
-            sign_text = f.read()
-            f.close()
-        self._randomSignature = creg.findall(sign_text)
-        return self._randomSignature
+        if changed:
+            self._rendered.clear()
+        return self.sign_pool.signatures
 
     def skip_page(self, user) -> bool:
         """Check whether the user is to be skipped."""
+        recheck_stage = self.recheck_stage.pop(user.username, -1)
+        self.timings = {}
+        self._stage_start = time.perf_counter()
         if user.isBlocked():
-            self.show_status(Msg.SKIP)
-            pywikibot.output('{} has been blocked!'.format(user.username))
+            self.stage('check')
+            self.report(Msg.SKIP, user, 'skip', 'blocked',
+                        '{} has been blocked!')
 
         elif 'bot' in user.groups():
-            self.show_status(Msg.SKIP)
-            pywikibot.output('{} is a bot!'.format(user.username))
+            self.stage('check')
+            self.report(Msg.SKIP, user, 'skip', 'bot', '{} is a bot!')
 
         elif 'bot' in user.username.lower():
-            self.show_status(Msg.SKIP)
-            pywikibot.output('{} might be a global bot!'
-                             .format(user.username))
+            self.stage('check')
+            self.report(Msg.SKIP, user, 'skip', 'bot name',
+                        '{} might be a global bot!')
 
         elif user.editCount() < globalvar.attachEditCount:
+            self.stage('check')
             if not user.editCount() == 0:
-                self.show_status(Msg.IGNORE)
-                pywikibot.output('{} has only {} contributions.'
-                                 .format(user.username, user.editCount()))
+                self.report(Msg.IGNORE, user, 'wait', 'few edits',
+                            '{} has only {} contributions.', user.editCount(),
+                            level='debug', edits=user.editCount())
             elif not globalvar.quiet:
-                self.show_status(Msg.IGNORE)
-                pywikibot.output('{} has no contributions.'
-                                 .format(user.username))
+                self.report(Msg.IGNORE, user, 'wait', 'no edits',
+                            '{} has no contributions.', level='debug',
+                            edits=0)
+            if self.rechecks:
+                self.rechecks.schedule(user.username, recheck_stage + 1)
+            return True
         else:
             return super().skip_page(user)
 
+        if self.rechecks:
+            self.rechecks.discard(user.username)
+        self.decided(user)
         return True
 
     def treat(self, user) -> None:
         """Run the bot."""
-        self.show_status(Msg.MATCH)
-        pywikibot.output('{} has enough edits to be welcomed.'
-                         .format(user.username))
-        ustp = user.getUserTalkPage()
-        if ustp.exists():
-            self.show_status(Msg.SKIP)
-            pywikibot.output('{} has been already welcomed.'
+        self.stage('check')
+        if globalvar.console:
+            self.show_status(Msg.MATCH)
+            pywikibot.output('{} has enough edits to be welcomed.'
                              .format(user.username))
+        ustp = user.getUserTalkPage()
+        # Existence is only known if it was preloaded; otherwise the
+        # create-only save below finds out. Bad names are not saved, so
+        # their talk page is checked first like on the preloaded path.
+        exists = self.talk_exists.pop(user.username, None)
+        bad_name = False
+        if not exists:
+            bad_name = self.badNameFilter(user.username)
+            self.stage('filter')
+            if bad_name and exists is None:
+                exists = ustp.exists()
+        if exists:
+            self.report(Msg.SKIP, user, 'skip', 'talk page exists',
+                        '{} has been already welcomed.')
+            self.decided(user)
             return
 
-        if self.badNameFilter(user.username):
+        if bad_name:
+            self.report(Msg.WARN, user, 'report', 'bad name',
+                        '{} contains the bad word {!r}.',
+                        self.bname[user.username], level='warning',
+                        bad_word=self.bname[user.username])
             self.collect_bad_accounts(user.username)
+            self.decided(user)
             return
 
-        welcome_text = self.welcome_text
-        if globalvar.randomSign:
-            if self.site.family.name != 'wikinews':
-                welcome_text = welcome_text % choice(self.defineSign())
-            if self.site.sitename != 'wiktionary:it':
-                welcome_text += timeselected
-        elif self.site.sitename != 'wikinews:it':
-            welcome_text = welcome_text % globalvar.defaultSign
-
-        final_text = i18n.translate(self.site, final_new_text_additions)
-        if final_text:
-            welcome_text += final_text
+        if self.random_sign:
+            welcome_text = self.welcome_message(self.sign_pool.next())
+        else:
+            welcome_text = self.welcome_message(globalvar.defaultSign)
+        welcome_text = self.personalize(welcome_text, user)
         welcome_comment = 'Chào mừng!'
+        if self.edit_budget:
+            self.edit_budget.acquire()
         try:
             # append welcomed, welcome_count++
-            ustp.put(welcome_text, welcome_comment, minor=False)
+            # createonly makes this a single write request: appendtext
+            # needs no base revision and force skips the {{bots}} check,
+            # both of which would read the page first.
+            ustp.save(summary=welcome_comment, minor=False, force=True,
+                      createonly=True, appendtext=welcome_text)
+        except PageCreatedConflictError:
+            self.stage('save')
+            self.report(Msg.SKIP, user, 'skip', 'talk page exists',
+                        '{} has been already welcomed.')
+            self.decided(user)
+            return
         except EditConflictError:
-            self.show_status(Msg.WARN)
-            pywikibot.output(
-                'An edit conflict has occurred, skipping this user.')
+            self.stage('save')
+            self.report(Msg.WARN, user, 'skip', 'edit conflict',
+                        'An edit conflict has occurred, skipping {}.',
+                        level='warning')
         else:
-            self.welcomed_users.append(user)
+            self.stage('save')
+            self.report(Msg.DONE, user, 'welcome', 'enough edits',
+                        '{} has been welcomed.', edits=user.editCount())
+            if self.make_welcome_log:
+                self.welcomed_users.append(
+                    (user.title(as_url=True, with_ns=False),
+                     user.editCount()))
+            if self.rechecks:
+                self.rechecks.discard(user.username)
+            self.decided(user)
 
         welcomed_count = len(self.welcomed_users)
-        if globalvar.makeWelcomeLog:
+        if self.make_welcome_log and globalvar.console:
             self.show_status(Msg.DONE)
             if welcomed_count == 0:
                 count = 'No users have'
@@ -535,13 +1781,16 @@ class WelcomeBot(SingleSiteBot):
                 count = '{} users have'.format(welcomed_count)
             pywikibot.output(count + ' been welcomed.')
 
-            if welcomed_count >= globalvar.dumpToLog:
-                self.makelogpage()
+        self.welcomed_users.flush_due()
+
+    def write_log(self, force: bool = False) -> None:
+        """Write logfile.
 
-    def write_log(self):
-        """Write logfile."""
+        :param force: write the queued entries even if they are not due
+        """
         welcomed_count = len(self.welcomed_users)
-        if globalvar.makeWelcomeLog and welcomed_count > 0:
+        if self.make_welcome_log and welcomed_count > 0 \
+           and (force or self.welcomed_users.due()):
             self.show_status()
             if welcomed_count == 1:
                 pywikibot.output('Putting the log of the latest user...')
@@ -549,39 +1798,123 @@ class WelcomeBot(SingleSiteBot):
                 pywikibot.output(
                     'Putting the log of the latest {} users...'
                     .format(welcomed_count))
-            self.makelogpage()
+            self.welcomed_users.flush()
 
-        if hasattr(self, '_BAQueue'):
+        if self._BAQueue and (force or self._BAQueue.due()):
             self.show_status()
             pywikibot.output('Putting bad name to report page...')
-            self.report_bad_account()
+            self._BAQueue.flush()
+
+        if self.event_log:
+            self.event_log.flush()
 
     @staticmethod
     def show_status(message=Msg.DEFAULT):
         """Output colorized status."""
-        msg, color = message.value
-        pywikibot.output(color_format('{color}[{msg:5}]{default} ',
-                                      msg=msg, color=color),
-                         newline=False)
+        pywikibot.output(status_headers[message], newline=False)
 
     def teardown(self):
         """Some cleanups after run operation."""
+        if self.async_poller:
+            self.async_poller.executor.shutdown()
+        if self.sul_filter:
+            self.sul_filter.executor.shutdown()
+        if self.request_memo:
+            pywikibot.output(str(self.request_memo))
+        self.seen.save()
+        if self.rechecks:
+            self.rechecks.save()
+
         if self.welcomed_users:
             self.show_status()
             pywikibot.output('Put welcomed users before quit...')
-            self.makelogpage()
+        self.write_log(force=True)
+        for queue in (self.welcomed_users, self._BAQueue):
+            if queue:
+                pywikibot.warning('{} entries could not be written.'
+                                  .format(len(queue)))
+
+        # With savedata, the rotation goes on where it stopped.
+        if self.sign_pool:
+            self.sign_pool.save(index=globalvar.saveSignIndex)
 
-        # If there is the savedata, the script must save the number_user.
-        if globalvar.randomSign and globalvar.saveSignIndex \
-           and self.welcomed_users:
-            # Filename and Pywikibot path
-            # file where is stored the random signature index
-            filename = pywikibot.config.datafilepath(
-                'welcome-{}-{}.data'.format(self.site.family.name,
-                                            self.site.code))
-            with open(filename, 'wb') as f:
-                pickle.dump(self.welcomed_users, f,
-                            protocol=config.pickle_protocol)
+
+class MultiSiteWelcomeRunner:
+
+    """Run a WelcomeBot for several sites in one process.
+
+    All bots share pywikibot's HTTP session and one :class:`EditBudget`;
+    each bot keeps its own word lists. The sites are polled in turn and
+    the runner sleeps once per round instead of once per site.
+    """
+
+    def __init__(self, sites, edit_budget=None) -> None:
+        """Initializer.
+
+        :param sites: sites to be served
+        :type sites: list of pywikibot.site.BaseSite
+        :param edit_budget: edit rate budget shared by all bots
+        :type edit_budget: EditBudget
+        """
+        self.bots = []
+        for site in sites:
+            try:
+                bot = WelcomeBot(site=site, edit_budget=edit_budget)
+            except KeyError as error:
+                # site not managed by welcome.py
+                pywikibot.warning(error)
+            else:
+                self.bots.append(bot)
+
+    def run(self) -> None:
+        """Poll and welcome new users on every site until stopped."""
+        if not self.bots:
+            pywikibot.error('None of the given sites is managed.')
+            return
+
+        for bot in self.bots:
+            bot.start()
+        try:
+            while True:
+                for bot in self.bots:
+                    try:
+                        bot.run_cycle()
+                    except Error as e:
+                        # one failing wiki must not stop the others
+                        pywikibot.error('Cycle on {} failed: {}'
+                                        .format(bot.site, e))
+                if not globalvar.recursive:
+                    break
+
+                WelcomeBot.show_status()
+                strfstr = time.strftime('%d %b %Y %H:%M:%S (UTC)',
+                                        time.gmtime())
+                pywikibot.output('Sleeping {} seconds before rerun on {} '
+                                 'sites. {}'.format(globalvar.timeRecur,
+                                                    len(self.bots), strfstr))
+                pywikibot.sleep(globalvar.timeRecur)
+        except KeyboardInterrupt:
+            pywikibot.output('\nKeyboardInterrupt during multi-site run...')
+        finally:
+            for bot in self.bots:
+                bot.exit()
+
+
+def screen_file(bot, filename) -> None:
+    """Screen the usernames listed in a file, one per line.
+
+    Bad usernames are written to stdout together with their bad words.
+    """
+    with codecs.open(filename, 'r', encoding='utf-8') as f:
+        names = [line.strip() for line in f if line.strip()]
+    bad_count = 0
+    for verdict in bot.screen_usernames(names):
+        if verdict.bad:
+            bad_count += 1
+            pywikibot.stdout('{}\t{}'.format(
+                verdict.name, ', '.join(verdict.bad_words)))
+    pywikibot.output('{} of {} usernames contain bad words.'
+                     .format(bad_count, len(names)))
 
 
 def load_word_function(raw) -> List[str]:
@@ -613,6 +1946,30 @@ def _handle_offset(val) -> None:
             'script source header for documentation.'))
 
 
+def _handle_backfill(val) -> None:
+    """Handle -backfill arg."""
+    if not val:
+        val = pywikibot.input(
+            'Which time range would you like to backfill? '
+            '(START-END or START, yyyymmddhhmmss or yyyymmdd)')
+    start, _, end = val.partition('-')
+    globalvar.backfill = (
+        pywikibot.Timestamp.fromtimestampformat(start),
+        pywikibot.Timestamp.fromtimestampformat(end) if end else None)
+
+
+def _handle_sites(val) -> None:
+    """Handle -sites arg."""
+    if not val:
+        val = pywikibot.input(
+            'Which sites would you like to serve? (comma separated, '
+            'family:code or code)')
+    globalvar.sites = []
+    for spec in val.split(','):
+        fam, _, code = spec.strip().rpartition(':')
+        globalvar.sites.append(pywikibot.Site(code, fam or None))
+
+
 def handle_args(args):
     """Process command line arguments.
 
@@ -631,15 +1988,21 @@ def handle_args(args):
         '-random': ('randomSign', True),
         '-sul': ('welcomeAuto', True),
         '-quiet': ('quiet', True),
+        '-async': ('asyncPoll', True),
+        '-expand': ('expandTemplates', True),
     }
 
-    for arg in pywikibot.handle_args(args):
+    local_args = handle_cassette_args(pywikibot.handle_args(args))
+    # -v is only known after pywikibot has handled the arguments
+    globalvar.console = sys.stderr.isatty() or config.verbose_output
+    for arg in local_args:
         arg, _, val = arg.partition(':')
         if arg == '-edit':
             globalvar.attachEditCount = int(
                 val if val.isdigit() else pywikibot.input(
                     'After how many edits would you like to welcome new users?'
                     ' (0 is allowed)'))
+            globalvar.recheckUsers = globalvar.attachEditCount > 0
         elif arg == '-timeoffset':
             globalvar.timeoffset = int(
                 val if val.isdigit() else pywikibot.input(
@@ -652,6 +2015,35 @@ def handle_args(args):
                     'before checking again?'))
         elif arg == '-offset':
             _handle_offset(val)
+        elif arg == '-sites':
+            _handle_sites(val)
+        elif arg == '-backfill':
+            _handle_backfill(val)
+        elif arg == '-sulage':
+            globalvar.sulAge = int(
+                val if val.isdigit() else pywikibot.input(
+                    'Skip global accounts older than how many days?'))
+        elif arg == '-shard':
+            globalvar.backfillShard = int(
+                val if val.isdigit() else pywikibot.input(
+                    'How many hours of the log should a backfill shard '
+                    'cover?'))
+        elif arg == '-screen':
+            globalvar.screenFile = val or pywikibot.input(
+                'Which file contains the usernames to be screened?')
+        elif arg == '-eventlog':
+            globalvar.eventLog = val or 'welcome-events-{family}-{code}.jsonl'
+        elif arg == '-loglevel':
+            if val not in EventLog.levels:
+                val = pywikibot.input_choice(
+                    'Which events would you like to log?',
+                    [(level, level[0]) for level in EventLog.levels], 'i')
+                val = {level[0]: level for level in EventLog.levels}[val]
+            globalvar.logLevel = val
+        elif arg == '-editrate':
+            globalvar.editRate = int(
+                val if val.isdigit() else pywikibot.input(
+                    'How many edits per minute are allowed over all sites?'))
         elif arg == '-file':
             globalvar.randomSign = True
             globalvar.signFileName = val or pywikibot.input(
@@ -670,6 +2062,11 @@ def handle_args(args):
                 val if val.isdigit() else pywikibot.input(
                     'After how many welcomed users would you like to update '
                     'the welcome log?'))
+        elif arg == '-logage':
+            globalvar.dumpAge = int(
+                val if val.isdigit() else pywikibot.input(
+                    'After how many seconds would you like to update the '
+                    'welcome log anyway?'))
         elif arg in mapping:
             setattr(globalvar, *mapping[arg])
         else:
@@ -687,13 +2084,28 @@ def main(*args: str) -> None:
             'both -offset and -timeoffset were provided, ignoring -offset')
         globalvar.offset = 0
 
+    edit_budget = None
+    if globalvar.editRate:
+        edit_budget = EditBudget(globalvar.editRate)
+    if globalvar.sites:
+        if globalvar.backfill or globalvar.screenFile:
+            pywikibot.bot.suggest_help(
+                additional_text='-backfill and -screen cannot be combined '
+                                'with -sites.')
+            return
+        MultiSiteWelcomeRunner(globalvar.sites, edit_budget).run()
+        return
+
     try:
-        bot = WelcomeBot()
+        bot = WelcomeBot(edit_budget=edit_budget)
     except KeyError as error:
         # site not managed by welcome.py
         pywikibot.bot.suggest_help(exception=error)
     else:
-        bot.run()
+        if globalvar.screenFile:
+            screen_file(bot, globalvar.screenFile)
+        else:
+            bot.run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,773 @@
+"""
+Load test of welcome3.py against a simulated wiki.
+
+Accounts are created in bursts on a local stand-in of the MediaWiki API
+while WelcomeBot runs against it in the same process; no request leaves
+the process. At the end, the time from account creation to welcome is
+reported as p50/p95/p99 together with the backlog of accounts waiting
+for a welcome over time and the API calls per welcomed user.
+
+The following parameters are supported:
+
+-rate:n           Accounts created per second during a burst (default: 2).
+
+-burst:n          Length of a burst in seconds (default: 10).
+
+-pause:n          Seconds between bursts (default: 20).
+
+-duration:n       Seconds during which accounts are created (default: 60).
+
+-drain:n          Seconds the bot may take after the last signup
+                  (default: 60).
+
+-bad:p            Proportion of usernames containing a bad word
+                  (default: 0.1).
+
+-blocked:p        Proportion of blocked accounts (default: 0.05).
+
+-auto:p           Proportion of auto-created accounts (default: 0.2).
+
+-inactive:p       Proportion of accounts without edits (default: 0.3).
+
+-apidelay:x       Seconds the stand-in takes to answer a request
+                  (default: 0.05).
+
+-compare:"args"   Run once per -compare option with these welcome3.py
+                  arguments and report the runs side by side, e.g.
+                  -compare:"-time:10 -limit:50" -compare:"-time:60".
+
+Other arguments are passed to welcome3.py for every run. Auto-created
+accounts are only welcomed with -sul, and bad names are only skipped
+with -filter on a wiki with a bad word page.
+"""
+from __future__ import annotations
+
+import json
+import random
+import re
+import shlex
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qsl, urlsplit
+
+import pywikibot
+import requests
+from pywikibot.comms import http
+from pywikibot.data.api import CachedRequest
+from pywikibot.site import APISite
+
+import welcome3
+from request_memo import RequestMemo
+
+BAD_WORDS = ("bitch", "cazzo", "merda", "puttana")
+
+ACTIONS = (
+    "query",
+    "edit",
+    "parse",
+    "paraminfo",
+    "login",
+    "clientlogin",
+)
+
+# query modules of the stand-in: (group, parameter prefix, limited)
+QUERY_MODULES = {
+    "info": ("prop", "in", False),
+    "revisions": ("prop", "rv", True),
+    "logevents": ("list", "le", True),
+    "users": ("list", "us", False),
+    "allusers": ("list", "au", True),
+    "siteinfo": ("meta", "si", False),
+    "userinfo": ("meta", "ui", False),
+    "tokens": ("meta", "", False),
+    "globaluserinfo": ("meta", "gui", False),
+}
+
+
+def _timestamp(seconds: float) -> str:
+    """Return a MediaWiki timestamp of the epoch seconds."""
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+
+
+def _seconds(timestamp: str) -> float:
+    """Return the epoch seconds of a MediaWiki timestamp."""
+    return (
+        datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+        .replace(tzinfo=timezone.utc)
+        .timestamp()
+    )
+
+
+def _choice(name: str, values: Any, **info: Any) -> dict:
+    """Return the paraminfo of a parameter with the allowed values."""
+    return dict(info, name=name, type=list(values))
+
+
+def module_info(path: str) -> dict:
+    """Return the paraminfo of an API module of the stand-in."""
+    multi = {"multi": "", "limit": 50, "highlimit": 500}
+    if path == "main":
+        parameters = [
+            _choice("action", ACTIONS, submodules={a: a for a in ACTIONS}),
+            _choice("format", ["json"], submodules={"json": "json"}),
+        ]
+    elif path == "paraminfo":
+        parameters = [
+            dict(multi, name="modules", type="string"),
+            _choice("querymodules", QUERY_MODULES, **multi),
+        ]
+    elif path == "query":
+        parameters = [
+            _choice(
+                group,
+                [m for m, (g, *_) in QUERY_MODULES.items() if g == group],
+                submodules={
+                    m: f"query+{m}"
+                    for m, (g, *_) in QUERY_MODULES.items()
+                    if g == group
+                },
+                **multi,
+            )
+            for group in ("prop", "list", "meta")
+        ]
+        parameters.append(
+            _choice(
+                "generator",
+                [m for m, (g, *_) in QUERY_MODULES.items() if g != "meta"],
+            )
+        )
+        parameters.append(dict(multi, name="titles", type="string"))
+    elif path.startswith("query+"):
+        name = path.partition("+")[2]
+        group, prefix, limited = QUERY_MODULES[name]
+        parameters = [
+            _choice("prop", ["info"], **multi),
+            _choice("type", ["", "newusers", "csrf", "login"], **multi),
+        ]
+        if limited:
+            parameters.append(
+                {"name": "limit", "type": "limit", "max": 500, "highmax": 5000}
+            )
+        return {
+            "name": name,
+            "path": path,
+            "group": group,
+            "prefix": prefix,
+            "parameters": parameters,
+        }
+    else:
+        parameters = []
+    info = {"name": path, "path": path, "prefix": "", "parameters": parameters}
+    if path in ("edit", "login", "clientlogin"):
+        info["mustbeposted"] = ""
+    return info
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Return the percentile of the values by nearest rank."""
+    ordered = sorted(values)
+    return ordered[max(0, round(fraction * len(ordered)) - 1)]
+
+
+class SimulatedWiki:
+    """
+    Local stand-in of the MediaWiki API for WelcomeBot.
+
+    It answers the queries the bot makes from an in-memory state of
+    accounts, log events and pages. Unknown queries get an empty
+    result, unknown actions an error; both are counted. Like a real
+    session, it is anonymous until the bot logs in.
+    """
+
+    username = "LoadTestBot"
+    password = "load-test"
+    user_namespace = "Thành viên"
+    talk_namespace = "Thảo luận Thành viên"
+    template_namespace = "Bản mẫu"
+
+    def __init__(self, latency: float = 0.05) -> None:
+        """Initialize."""
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.users: dict[str, dict] = {}
+        self.log: list[dict] = []
+        self.pages: dict[str, dict] = {}
+        self.welcomed: dict[str, float] = {}
+        self.calls: Counter = Counter()
+        self.unknown: Counter = Counter()
+        self.next_id = 1000
+        self.logged_in = False
+        # substituted by the welcome text of vi
+        self.pages[f"{self.template_namespace}:Welcome3"] = {
+            "pageid": 1,
+            "revid": 1,
+            "text": "Chào mừng bạn đến với Wikipedia tiếng Việt!",
+            "timestamp": _timestamp(time.time()),
+        }
+
+    # simulation
+
+    def signup(self, name: str, **props: Any) -> None:
+        """Create an account."""
+        with self.lock:
+            self.next_id += 1
+            now = time.time()
+            self.users[name] = dict(props, userid=self.next_id, created=now)
+            self.log.append(
+                {
+                    "logid": self.next_id,
+                    "type": "newusers",
+                    "action": "autocreate" if props["auto"] else "create",
+                    "title": f"{self.user_namespace}:{name}",
+                    "ns": 2,
+                    "user": name,
+                    "timestamp": _timestamp(now),
+                    "params": {"userid": self.next_id},
+                }
+            )
+
+    def waiting(self, eligible: set[str]) -> int:
+        """Return the number of eligible accounts not welcomed yet."""
+        with self.lock:
+            return len(eligible - self.welcomed.keys())
+
+    # HTTP
+
+    def fetch(
+        self, uri: str, method: str = "GET", **kwargs: Any
+    ) -> requests.Response:
+        """Answer a request of pywikibot."""
+        params = dict(parse_qsl(urlsplit(uri).query, keep_blank_values=True))
+        data = kwargs.get("data")
+        if isinstance(data, bytes):
+            data = data.decode()
+        if isinstance(data, str):
+            params.update(parse_qsl(data, keep_blank_values=True))
+        elif isinstance(data, dict):
+            params.update(data)
+        time.sleep(self.latency)
+        with self.lock:
+            result = self.handle(params)
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["content-type"] = "application/json"
+        response._content = json.dumps(result).encode()
+        response.encoding = "utf-8"
+        response.url = uri
+        return response
+
+    def handle(self, params: dict[str, str]) -> dict:
+        """Return the result of an API request."""
+        action = params.get("action", "")
+        self.calls[action] += 1
+        if action == "query":
+            return self.query(params)
+        if action == "edit":
+            return self.edit(params)
+        if action == "clientlogin":
+            return self.clientlogin(params)
+        if action == "paraminfo":
+            return {
+                "paraminfo": {
+                    "modules": [
+                        module_info(path)
+                        for path in params.get("modules", "").split("|")
+                        if path.partition("+")[2] in QUERY_MODULES
+                        or path in ("main", "paraminfo", *ACTIONS)
+                    ]
+                }
+            }
+        if action == "parse":
+            return self.parse(params)
+        self.unknown[action] += 1
+        return {"error": {"code": "unknown_action", "info": action}}
+
+    def query(self, params: dict[str, str]) -> dict:
+        """Answer action=query."""
+        query: dict[str, Any] = {}
+        for meta in filter(None, params.get("meta", "").split("|")):
+            handler = getattr(self, f"meta_{meta}", None)
+            if handler is None:
+                self.unknown[f"meta={meta}"] += 1
+                continue
+            query[meta] = handler(params)
+        for name in filter(None, params.get("list", "").split("|")):
+            handler = getattr(self, f"list_{name}", None)
+            if handler is None:
+                self.unknown[f"list={name}"] += 1
+                continue
+            query[name] = handler(params)
+        if "titles" in params:
+            query["pages"] = self.pages_info(params)
+        for key in list(query):
+            if key == "siteinfo":
+                query.update(query.pop(key))
+        return {"batchcomplete": "", "query": query}
+
+    def meta_siteinfo(self, params: dict[str, str]) -> dict:
+        """Answer meta=siteinfo."""
+        namespaces = {
+            str(number): {"id": number, "case": "first-letter", "*": name}
+            for number, name in (
+                (-2, "Phương tiện"),
+                (-1, "Đặc biệt"),
+                (0, ""),
+                (1, "Thảo luận"),
+                (2, self.user_namespace),
+                (3, self.talk_namespace),
+                (4, "Wikipedia"),
+                (5, "Thảo luận Wikipedia"),
+                (6, "Tập tin"),
+                (8, "MediaWiki"),
+                (10, "Bản mẫu"),
+                (12, "Trợ giúp"),
+                (14, "Thể loại"),
+            )
+        }
+        for data in namespaces.values():
+            data["canonical"] = {
+                2: "User",
+                3: "User talk",
+                10: "Template",
+                14: "Category",
+            }.get(data["id"], data["*"])
+            if data["id"] in (0, 2, 3):
+                data["content"] = ""
+        return {
+            "general": {
+                "sitename": "Wikipedia",
+                "generator": "MediaWiki 1.39.0",
+                "lang": "vi",
+                "case": "first-letter",
+                "wikiid": "viwiki",
+                "articlepath": "/wiki/$1",
+                "server": "//vi.wikipedia.org",
+                "servername": "vi.wikipedia.org",
+                "script": "/w/index.php",
+                "linktrail": "/^([a-z]+)(.*)$/sD",
+                "timezone": "UTC",
+                "timeoffset": 0,
+                "maxarticlesize": 2097152,
+                "writeapi": "",
+                "time": _timestamp(time.time()),
+            },
+            "namespaces": namespaces,
+            "namespacealiases": [],
+            "interwikimap": [],
+            "extensions": [],
+        }
+
+    def meta_userinfo(self, params: dict[str, str]) -> dict:
+        """Answer meta=userinfo for the session."""
+        if not self.logged_in:
+            return {
+                "id": 0,
+                "name": "127.0.0.1",
+                "anon": "",
+                "groups": ["*"],
+                "rights": ["read", "edit", "createtalk"],
+                "ratelimits": {"edit": {"ip": {"hits": 8, "seconds": 60}}},
+            }
+        return {
+            "id": 1,
+            "name": self.username,
+            "groups": ["*", "user", "bot"],
+            "rights": ["read", "edit", "createpage", "createtalk", "bot"],
+            "ratelimits": {},
+            "messages": "",
+        }
+
+    def meta_tokens(self, params: dict[str, str]) -> dict:
+        """Answer meta=tokens."""
+        if params.get("type") == "login":
+            return {"logintoken": "4567cdef+\\"}
+        # the token of anonymous sessions is always the same
+        return {"csrftoken": "0123abcd+\\" if self.logged_in else "+\\"}
+
+    def list_allusers(self, params: dict[str, str]) -> list[dict]:
+        """Answer list=allusers for the account of the bot."""
+        return [{"userid": 1, "name": self.username}]
+
+    def clientlogin(self, params: dict[str, str]) -> dict:
+        """Answer action=clientlogin."""
+        if (params.get("username"), params.get("password")) != (
+            self.username,
+            self.password,
+        ):
+            return {
+                "clientlogin": {
+                    "status": "FAIL",
+                    "message": "Incorrect username or password entered.",
+                }
+            }
+        self.logged_in = True
+        return {"clientlogin": {"status": "PASS", "username": self.username}}
+
+    def meta_globaluserinfo(self, params: dict[str, str]) -> dict:
+        """Answer meta=globaluserinfo from the local account."""
+        user = self.users.get(params.get("guiuser", ""))
+        if user is None:
+            return {"missing": ""}
+        return {
+            "name": params["guiuser"],
+            "registration": _timestamp(user["created"]),
+            "groups": [],
+        }
+
+    def list_logevents(self, params: dict[str, str]) -> list[dict]:
+        """Answer list=logevents of the newusers log, newest first."""
+        events = self.log[::-1]
+        if "lestart" in params:
+            start = _seconds(params["lestart"])
+            events = [e for e in events if _seconds(e["timestamp"]) <= start]
+        limit = params.get("lelimit", "50")
+        return events[: 500 if limit == "max" else int(limit)]
+
+    def list_users(self, params: dict[str, str]) -> list[dict]:
+        """Answer list=users."""
+        result = []
+        for name in params.get("ususers", "").split("|"):
+            user = self.users.get(name)
+            if user is None:
+                result.append({"name": name, "missing": ""})
+                continue
+            props = {
+                "userid": user["userid"],
+                "name": name,
+                "editcount": user["edits"],
+                "registration": _timestamp(user["created"]),
+                "groups": ["*", "user"],
+            }
+            if user["blocked"]:
+                props.update(
+                    blockid=user["userid"],
+                    blockedby="Admin",
+                    blockreason="",
+                    blockexpiry="infinity",
+                )
+            result.append(props)
+        return result
+
+    def pages_info(self, params: dict[str, str]) -> dict | list[dict]:
+        """Answer the page properties of titles."""
+        version2 = params.get("formatversion") == "2"
+        pages = {}
+        for number, title in enumerate(params["titles"].split("|")):
+            page = self.pages.get(title)
+            if page is None:
+                pages[str(-1 - number)] = {
+                    "ns": 0,
+                    "title": title,
+                    "missing": True if version2 else "",
+                }
+                continue
+            entry = {
+                "pageid": page["pageid"],
+                "ns": 0,
+                "title": title,
+                "lastrevid": page["revid"],
+                "length": len(page["text"]),
+                "touched": page["timestamp"],
+                "contentmodel": "wikitext",
+            }
+            if "revisions" in params.get("prop", ""):
+                entry["revisions"] = [
+                    {
+                        "revid": page["revid"],
+                        "parentid": 0,
+                        "timestamp": page["timestamp"],
+                        "user": self.username,
+                        "comment": "",
+                        "slots": {
+                            "main": {
+                                "contentmodel": "wikitext",
+                                "contentformat": "text/x-wiki",
+                                "content" if version2 else "*": page["text"],
+                            }
+                        },
+                    }
+                ]
+            pages[str(page["pageid"])] = entry
+        return list(pages.values()) if version2 else pages
+
+    def parse(self, params: dict[str, str]) -> dict:
+        """Answer action=parse with the pre-save transform only."""
+        if "onlypst" not in params:
+            self.unknown["parse"] += 1
+            return {"error": {"code": "unknown_action", "info": "parse"}}
+
+        def substitute(match: re.Match) -> str:
+            name = match[1][:1].upper() + match[1][1:]
+            page = self.pages.get(f"{self.template_namespace}:{name}")
+            return match[0] if page is None else page["text"]
+
+        text = welcome3.WelcomeBot.subst_regex.sub(substitute, params["text"])
+        return {"parse": {"title": params["title"], "text": text}}
+
+    def edit(self, params: dict[str, str]) -> dict:
+        """Answer action=edit."""
+        if params.get("assert") == "user" and not self.logged_in:
+            return {
+                "error": {
+                    "code": "assertuserfailed",
+                    "info": "You are no longer logged in.",
+                }
+            }
+        title = params["title"]
+        page = self.pages.get(title)
+        if page is not None and "createonly" in params:
+            return {
+                "error": {
+                    "code": "articleexists",
+                    "info": "The article you tried to create has been "
+                    "created already.",
+                }
+            }
+        text = params.get("text") or params.get("appendtext", "")
+        self.next_id += 1
+        if page is None:
+            page = self.pages[title] = {"pageid": self.next_id, "text": ""}
+        page["text"] = text if "text" in params else page["text"] + text
+        page["revid"] = self.next_id
+        page["timestamp"] = _timestamp(time.time())
+        namespace, _, name = title.partition(":")
+        if namespace == self.talk_namespace:
+            self.welcomed[name] = time.time()
+        return {
+            "edit": {
+                "result": "Success",
+                "pageid": page["pageid"],
+                "title": title,
+                "newrevid": page["revid"],
+                "newtimestamp": page["timestamp"],
+            }
+        }
+
+
+class SignupBursts(threading.Thread):
+    """Create accounts on the simulated wiki in bursts."""
+
+    def __init__(self, wiki: SimulatedWiki, options: dict[str, float]):
+        """Initialize."""
+        super().__init__(daemon=True)
+        self.wiki = wiki
+        self.options = options
+        self.eligible: set[str] = set()
+        self.created = 0
+        self.depths: list[tuple[float, int]] = []
+
+    def run(self) -> None:
+        """Create the accounts and sample the backlog each second."""
+        opt = self.options
+        start = next_sample = now = time.time()
+        cycle = opt["burst"] + opt["pause"]
+        while now < start + opt["duration"]:
+            in_burst = (now - start) % cycle < opt["burst"]
+            if in_burst:
+                self.create()
+            if now >= next_sample:
+                self.depths.append(
+                    (now - start, self.wiki.waiting(self.eligible))
+                )
+                next_sample += 1
+            time.sleep(1 / opt["rate"] if in_burst else 0.1)
+            now = time.time()
+
+    def create(self) -> None:
+        """Create one account with random properties."""
+        opt = self.options
+        self.created += 1
+        name = f"Người dùng {self.created}"
+        bad = random.random() < opt["bad"]
+        if bad:
+            name = f"{random.choice(BAD_WORDS).title()} {self.created}"
+        props = {
+            "auto": random.random() < opt["auto"],
+            "blocked": random.random() < opt["blocked"],
+            "edits": 0 if random.random() < opt["inactive"] else 3,
+        }
+        if not (
+            props["blocked"]
+            or props["edits"] < welcome3.globalvar.attachEditCount
+            or (bad and welcome3.globalvar.filtBadName)
+            or (props["auto"] and not welcome3.globalvar.welcomeAuto)
+        ):
+            self.eligible.add(name)
+        self.wiki.signup(name, **props)
+
+
+def run_scenario(
+    bot_args: list[str], options: dict[str, float], directory: str
+) -> dict[str, Any]:
+    """
+    Run the bot against one simulated signup load.
+
+    :param bot_args: arguments of welcome3.py
+    :param options: options of the signup load
+    :param directory: directory of the files of all runs
+    """
+    for name, value in vars(welcome3.Global).items():
+        if not name.startswith("_"):
+            setattr(welcome3.globalvar, name, value)
+    welcome3.handle_args(bot_args)
+    welcome3.globalvar.console = False
+    # every run starts without the files, caches and throttle state of
+    # the previous one; pywikibot expects the throttle file of its process
+    pywikibot.config.base_dir = tempfile.mkdtemp(prefix="run-", dir=directory)
+    Path(pywikibot.config.base_dir, "throttle.ctrl").touch()
+    # the cache directory is fixed by the first run
+    for path in Path(CachedRequest._get_cache_dir()).iterdir():
+        path.unlink()
+    pywikibot.config.usernames["wikipedia"]["vi"] = SimulatedWiki.username
+    password_file = Path(pywikibot.config.base_dir, "passwordfile")
+    password_file.touch(mode=0o600)
+    password_file.write_text(
+        repr((SimulatedWiki.username, SimulatedWiki.password)) + "\n"
+    )
+    pywikibot.config.password_file = str(password_file)
+    memo = RequestMemo.install()
+    memo.clear()
+    memo.hits = memo.misses = 0
+
+    wiki = SimulatedWiki(options["apidelay"])
+    original_fetch = http.fetch
+    http.fetch = wiki.fetch
+    # not pywikibot.Site(), which returns the site of the previous run
+    site = APISite("vi", "wikipedia", user=SimulatedWiki.username)
+    bot = welcome3.WelcomeBot(site=site)
+    runner = threading.Thread(target=bot.run, daemon=True)
+    bursts = SignupBursts(wiki, options)
+    bursts.start()
+    runner.start()
+    try:
+        bursts.join()
+        deadline = time.time() + options["drain"]
+        while time.time() < deadline and wiki.waiting(bursts.eligible):
+            bursts.depths.append(
+                (
+                    bursts.depths[-1][0] + 1 if bursts.depths else 0,
+                    wiki.waiting(bursts.eligible),
+                )
+            )
+            time.sleep(1)
+    finally:
+        welcome3.globalvar.recursive = False
+        runner.join(welcome3.globalvar.timeRecur + 30)
+        if runner.is_alive():
+            # the bot would go on with the real wiki
+            raise RuntimeError("WelcomeBot did not stop; aborting")
+        http.fetch = original_fetch
+
+    latencies = [
+        wiki.welcomed[name] - wiki.users[name]["created"]
+        for name in bursts.eligible
+        if name in wiki.welcomed
+    ]
+    welcomed = len(wiki.welcomed)
+    return {
+        "args": " ".join(bot_args) or "(defaults)",
+        "created": bursts.created,
+        "eligible": len(bursts.eligible),
+        "welcomed": welcomed,
+        "missed": len(bursts.eligible - wiki.welcomed.keys()),
+        "latencies": latencies,
+        "depths": bursts.depths,
+        "calls": sum(wiki.calls.values()),
+        "unknown": wiki.unknown,
+    }
+
+
+def report(results: list[dict[str, Any]]) -> None:
+    """Output the results of the runs side by side."""
+    rows = [
+        ("accounts created", lambda r: r["created"]),
+        ("eligible for welcome", lambda r: r["eligible"]),
+        ("welcomed", lambda r: r["welcomed"]),
+        ("eligible not welcomed", lambda r: r["missed"]),
+        ("latency p50 (s)", lambda r: percentile(r["latencies"], 0.5)),
+        ("latency p95 (s)", lambda r: percentile(r["latencies"], 0.95)),
+        ("latency p99 (s)", lambda r: percentile(r["latencies"], 0.99)),
+        ("backlog max", lambda r: max(d for _, d in r["depths"])),
+        (
+            "backlog mean",
+            lambda r: statistics.mean(d for _, d in r["depths"]),
+        ),
+        ("API calls", lambda r: r["calls"]),
+        ("API calls per welcome", lambda r: r["calls"] / r["welcomed"]),
+    ]
+    width = max(24, *(len(result["args"]) + 2 for result in results))
+    lines = ["".ljust(24) + "".join(r["args"].rjust(width) for r in results)]
+    for label, value in rows:
+        cells = []
+        for result in results:
+            try:
+                cell = value(result)
+            except (IndexError, ValueError, ZeroDivisionError):
+                cell = "-"
+            if isinstance(cell, float):
+                cell = f"{cell:.2f}"
+            cells.append(str(cell).rjust(width))
+        lines.append(label.ljust(24) + "".join(cells))
+    pywikibot.output("\n".join(lines))
+
+    for result in results:
+        pywikibot.output(f"\nBacklog over time for {result['args']}:")
+        depths = result["depths"][:: max(1, len(result["depths"]) // 20)]
+        pywikibot.output(
+            "  ".join(f"{int(second)}s:{depth}" for second, depth in depths)
+        )
+        if result["unknown"]:
+            pywikibot.warning(
+                "Requests not simulated: "
+                + ", ".join(f"{k} ({v})" for k, v in result["unknown"].items())
+            )
+
+
+def main(*args: str) -> int:
+    """
+    Process command line arguments and run the load tests.
+
+    :param args: command line arguments
+    """
+    options = {
+        "rate": 2.0,
+        "burst": 10.0,
+        "pause": 20.0,
+        "duration": 60.0,
+        "drain": 60.0,
+        "bad": 0.1,
+        "blocked": 0.05,
+        "auto": 0.2,
+        "inactive": 0.3,
+        "apidelay": 0.05,
+    }
+    scenarios = []
+    bot_args = []
+    for arg in pywikibot.handle_args(args):
+        name, _, value = arg.partition(":")
+        if name[1:] in options:
+            options[name[1:]] = float(value)
+        elif name == "-compare":
+            scenarios.append(shlex.split(value))
+        else:
+            bot_args.append(arg)
+    # keep the files of the bot and pywikibot away from the real ones
+    with tempfile.TemporaryDirectory(prefix="welcome-load-") as directory:
+        results = [
+            run_scenario(bot_args + scenario, options, directory)
+            for scenario in scenarios or [[]]
+        ]
+    report(results)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())